@@ -0,0 +1,45 @@
+"""Benchmark content hash throughput per algorithm in GB/s."""
+import os
+from pathlib import Path
+import sys
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from bripy.bllb.file import available_algorithms, hash_blocks
+
+SIZE = 512 * 1024 * 1024
+RUNS = 3
+
+
+def bench(path, algorithms, runs=RUNS):
+    size = Path(path).stat().st_size
+    results = {}
+    hash_blocks(path, algorithms[0])  # warm the page cache
+    for algorithm in algorithms:
+        best = float('inf')
+        for _ in range(runs):
+            start = perf_counter()
+            hash_blocks(path, algorithm)
+            best = min(best, perf_counter() - start)
+        results[algorithm] = size / best / 1e9
+        print(f'{algorithm:>10}: {results[algorithm]:6.2f} GB/s')
+    return results
+
+
+def main(path=None):
+    algorithms = available_algorithms()
+    if path is not None:
+        bench(path, algorithms)
+        return 0
+    with TemporaryDirectory() as tmp:
+        path = Path(tmp) / 'bench.bin'
+        with path.open('wb') as file:
+            for _ in range(SIZE // (1024 * 1024)):
+                file.write(os.urandom(1024 * 1024))
+        print(f'{SIZE / 1e9:.2f} GB test file, best of {RUNS} runs')
+        bench(path, algorithms)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(*sys.argv[1:2]))
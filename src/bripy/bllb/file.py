@@ -1,13 +1,46 @@
 #!/usr/bin/env python
 """bllb file helpers."""
-from hashlib import md5
+import hashlib
 from itertools import islice
+import mmap
+import os
 from pathlib import Path
+from stat import S_ISREG
+from typing import Iterable, List, Optional, Tuple
 
-from fsspec import get_fs_token_paths
+from fsspec.implementations.local import LocalFileSystem
 
+from bripy.bllb.fs_cache import get_fs
+from bripy.bllb.hash_cache import HashCache, open_hash_cache
 from bripy.bllb.logging import logger, DBG
 
+BLOCKSIZE = 1024 * 2048
+DEFAULT_ALGORITHM = 'md5'
+XXHASH_ALGORITHMS = ('xxh3_64', 'xxh3_128', 'xxh64', 'xxh32')
+XXHASH_ALIASES = {'xxh3': 'xxh3_64', 'xxhash': 'xxh3_64'}
+MMAP_THRESHOLD = 1024 * 1024 * 64
+
+_hash_cache: Optional[HashCache] = None
+
+
+def set_hash_cache(cache) -> Optional[HashCache]:
+    """Make cache the hash cache consulted by every hash_blocks call.
+
+    cache may be a HashCache, a database path or None to disable caching.
+    Returns the previous cache.
+    """
+    global _hash_cache
+    previous = _hash_cache
+    if cache is not None and not isinstance(cache, HashCache):
+        cache = open_hash_cache(str(cache))
+    _hash_cache = cache
+    return previous
+
+
+def get_hash_cache() -> Optional[HashCache]:
+    """Return the active hash cache, if any."""
+    return _hash_cache
+
 
 def gen_lines(filename: str):
     """Generate clean lines from txt."""
@@ -66,17 +99,120 @@ def try_read(filename):  # pragma: no cover
         pass
 
 
-def md5_blocks(path, blocksize=1024 * 2048) -> str:
+def get_hasher(algorithm: str = DEFAULT_ALGORITHM):
+    """Return a new hash object for algorithm.
+
+    Supports any ``hashlib`` algorithm and, when the xxhash package is
+    installed, xxh3_64 (alias xxh3), xxh3_128, xxh32 and xxh64.
+    """
+    algorithm = XXHASH_ALIASES.get(algorithm, algorithm)
+    if algorithm.startswith('xxh'):
+        try:
+            import xxhash
+        except ImportError as error:
+            logger.error(f'Hash algorithm {algorithm} requires xxhash.')
+            raise error
+        return getattr(xxhash, algorithm)()
+    return hashlib.new(algorithm)
+
+
+def available_algorithms() -> List[str]:
+    """Return supported fast content hash algorithms that are installed."""
+    algorithms = ['md5', 'sha1', 'blake2b']
+    try:
+        import xxhash  # noqa
+        algorithms.extend(XXHASH_ALGORITHMS)
+    except ImportError:
+        DBG('xxhash not installed.')
+    return algorithms
+
+
+def hash_file(file,
+              algorithm: str = DEFAULT_ALGORITHM,
+              blocksize: int = BLOCKSIZE) -> str:
+    """Hash an open binary file object.
+
+    Blocks are read into one reused buffer with ``readinto`` when the file
+    supports it, so no new bytes object is allocated per block.
+    """
+    hasher = get_hasher(algorithm)
+    readinto = getattr(file, 'readinto', None)
+    if readinto is None:
+        block = file.read(blocksize)
+        while block:
+            hasher.update(block)
+            block = file.read(blocksize)
+        return hasher.hexdigest()
+    buffer = bytearray(blocksize)
+    view = memoryview(buffer)
+    size = readinto(buffer)
+    while size:
+        hasher.update(view[:size])
+        size = readinto(buffer)
+    return hasher.hexdigest()
+
+
+def hash_mmap(file,
+              algorithm: str = DEFAULT_ALGORITHM,
+              blocksize: int = BLOCKSIZE) -> str:
+    """Hash an open regular file through a read-only memory map.
+
+    memoryview slices of the map are fed straight to the hasher, so file
+    data is never copied into intermediate bytes objects.
+    """
+    hasher = get_hasher(algorithm)
+    with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        if hasattr(mapped, 'madvise'):
+            mapped.madvise(mmap.MADV_SEQUENTIAL)
+        view = memoryview(mapped)
+        try:
+            for offset in range(0, len(view), blocksize):
+                hasher.update(view[offset:offset + blocksize])
+        finally:
+            view.release()
+    return hasher.hexdigest()
+
+
+def hash_blocks(path,
+                algorithm: str = DEFAULT_ALGORITHM,
+                blocksize: int = BLOCKSIZE,
+                mmap_threshold: Optional[int] = MMAP_THRESHOLD,
+                cache: Optional[HashCache] = None) -> str:
+    """Hash a local file with algorithm.
+
+    Regular files of at least mmap_threshold bytes are memory mapped.
+    Smaller files, pipes and special files use buffered reads, as does
+    everything when mmap_threshold is None.  Regular files are looked up
+    in cache, or the active hash cache, before any content is read.
+    """
     path = Path(path)
+    cache = _hash_cache if cache is None else cache
     if not path.is_dir():
         try:
-            hasher = md5()
-            with path.open('rb') as file:
-                block = file.read(blocksize)
-                while len(block) > 0:
-                    hasher.update(block)
-                    block = file.read(blocksize)
-            return hasher.hexdigest()
+            st = None
+            if cache is not None:
+                st = os.stat(path)
+                if S_ISREG(st.st_mode):
+                    digest = cache.get(st, algorithm)
+                    if digest is not None:
+                        return digest
+            with path.open('rb', buffering=0) as file:
+                opened = os.fstat(file.fileno())
+                if (mmap_threshold is not None and S_ISREG(opened.st_mode)
+                        and opened.st_size
+                        and opened.st_size >= mmap_threshold):
+                    try:
+                        digest = hash_mmap(file, algorithm, blocksize)
+                    except (OSError, ValueError) as error:
+                        DBG(f'mmap failed, using buffered reads.  {error}')
+                        file.seek(0)
+                        digest = hash_file(file, algorithm, blocksize)
+                else:
+                    digest = hash_file(file, algorithm, blocksize)
+            if (st is not None and S_ISREG(st.st_mode)
+                    and st.st_mtime_ns == os.stat(path).st_mtime_ns):
+                cache.put(st, algorithm, digest)
+            return digest
         except Exception as error:
             logger.warning(
                 f'Error trying to hash item: {str(path)}\nError:\n{error}')
@@ -86,20 +222,73 @@ def md5_blocks(path, blocksize=1024 * 2048) -> str:
         return
 
 
-def md5_blocks_fs(path, blocksize=1024 * 2048) -> str:
-    fs, token, paths = get_fs_token_paths(path)
-    if fs.isdir(path):
-        DBG(f'Item is a directory and will not be hashed.  {str(path)}')
-        return
+def hash_blocks_fs(path,
+                   algorithm: str = DEFAULT_ALGORITHM,
+                   blocksize: int = BLOCKSIZE,
+                   fs=None,
+                   info: Optional[dict] = None,
+                   cache: Optional[HashCache] = None) -> str:
+    """Hash a file on any fsspec filesystem with algorithm.
+
+    Local files are passed to hash_blocks so they can be memory mapped,
+    remote files are read with buffered reads.  Pass an already resolved
+    fs to skip filesystem resolution, and the info dict from a listing to
+    skip the info request.  Remote files are looked up in cache, or the
+    active hash cache, by protocol, path, version and size.
+    """
+    if fs is None:
+        fs, path = get_fs(path)
+    if isinstance(fs, LocalFileSystem):
+        return hash_blocks(fs._strip_protocol(path), algorithm, blocksize,
+                           cache=cache)
+    cache = _hash_cache if cache is None else cache
     try:
-        hasher = md5()
+        if info is None:
+            info = fs.info(path)
+        if info.get('type') == 'directory':
+            DBG(f'Item is a directory and will not be hashed.  {str(path)}')
+            return
+        if cache is not None:
+            protocol = fs.protocol if isinstance(fs.protocol,
+                                                 str) else fs.protocol[0]
+            stripped = fs._strip_protocol(path)
+            digest = cache.get_remote(protocol, stripped, info, algorithm)
+            if digest is not None:
+                return digest
         with fs.open(path, 'rb') as file:
-            block = file.read(blocksize)
-            while len(block) > 0:
-                hasher.update(block)
-                block = file.read(blocksize)
-        return hasher.hexdigest()
+            digest = hash_file(file, algorithm, blocksize)
+        if cache is not None:
+            cache.put_remote(protocol, stripped, info, algorithm, digest)
+        return digest
     except Exception as error:
         logger.warning(
             f'Error trying to hash item: {str(path)}\nError:\n{error}')
         return
+
+
+def hash_batch(items: Iterable[Tuple[int, str]],
+               algorithm: str = DEFAULT_ALGORITHM,
+               blocksize: int = BLOCKSIZE,
+               cache: Optional[str] = None) -> List[Tuple[int, str]]:
+    """Hash a batch of (path_id, path) items.
+
+    Returns compact (path_id, digest) tuples, which keeps inter-process
+    traffic small when used as a process pool task.  cache is the database
+    path of a hash cache, opened once per worker process and committed
+    after every batch.
+    """
+    cache = None if cache is None else open_hash_cache(cache)
+    results = [(path_id, hash_blocks(path, algorithm, blocksize,
+                                     cache=cache))
+               for path_id, path in items]
+    if cache is not None:
+        cache.commit()
+    return results
+
+
+def md5_blocks(path, blocksize=BLOCKSIZE) -> str:
+    return hash_blocks(path, 'md5', blocksize)
+
+
+def md5_blocks_fs(path, blocksize=BLOCKSIZE, fs=None) -> str:
+    return hash_blocks_fs(path, 'md5', blocksize, fs)
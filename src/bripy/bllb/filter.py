@@ -0,0 +1,207 @@
+"""Walk filters compiled once and applied during traversal.
+
+A FilterSpec combines gitignore-style patterns with size, mtime and
+extension bounds.  Walkers ask it about every entry as it is listed, so
+excluded directories are never descended into and excluded files are
+never stat'ed twice or hashed.  Paths are matched relative to the walk
+root with ``/`` separators.
+"""
+from datetime import datetime
+import os
+import re
+from typing import Iterable, List, NamedTuple, Optional
+
+from bripy.bllb.logging import DBG
+
+__all__ = ['FilterSpec', 'Pattern', 'compile_pattern', 'DEFAULT_EXCLUDES']
+
+DEFAULT_EXCLUDES = ('.git/', '.hg/', '.svn/', 'node_modules/',
+                    '__pycache__/', 'dask-worker-space/',
+                    '.ipynb_checkpoints/')
+
+
+class Pattern(NamedTuple):
+    regex: str
+    negate: bool
+    dir_only: bool
+
+
+def _translate(pattern: str) -> str:
+    """Translate a gitignore glob to a regular expression."""
+    parts = []
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith('**/', i):
+            parts.append('(?:.*/)?')
+            i += 3
+        elif pattern.startswith('/**', i) and i + 3 == len(pattern):
+            parts.append('/.*')
+            i += 3
+        elif pattern.startswith('**', i):
+            parts.append('.*')
+            i += 2
+        elif pattern[i] == '*':
+            parts.append('[^/]*')
+            i += 1
+        elif pattern[i] == '?':
+            parts.append('[^/]')
+            i += 1
+        elif pattern[i] == '[' and ']' in pattern[i + 2:]:
+            end = pattern.index(']', i + 2)
+            body = pattern[i + 1:end]
+            if body.startswith('!'):
+                body = '^' + body[1:]
+            parts.append(f'[{body}]')
+            i = end + 1
+        elif pattern[i] == '\\' and i + 1 < len(pattern):
+            parts.append(re.escape(pattern[i + 1]))
+            i += 2
+        else:
+            parts.append(re.escape(pattern[i]))
+            i += 1
+    return ''.join(parts)
+
+
+def compile_pattern(line: str) -> Optional[Pattern]:
+    """Compile one gitignore line, or return None for blanks and comments."""
+    line = line.rstrip('\n').rstrip()
+    if not line or line.startswith('#'):
+        return None
+    negate = line.startswith('!')
+    if negate:
+        line = line[1:]
+    dir_only = line.endswith('/')
+    line = line.rstrip('/')
+    anchored = '/' in line
+    regex = _translate(line.lstrip('/'))
+    if not anchored:
+        regex = '(?:.*/)?' + regex
+    return Pattern(regex, negate, dir_only)
+
+
+class FilterSpec:
+    """Compiled include/exclude rules for filesystem walks.
+
+    patterns follow gitignore rules: the last matching pattern wins, ``!``
+    re-includes, a trailing ``/`` matches directories only and a pattern
+    containing ``/`` is anchored at the walk root.  Size, mtime (epoch
+    seconds) and extension bounds apply to files only.
+    """
+
+    def __init__(self,
+                 patterns: Iterable[str] = (),
+                 min_size: Optional[int] = None,
+                 max_size: Optional[int] = None,
+                 newer_than: Optional[float] = None,
+                 older_than: Optional[float] = None,
+                 extensions: Optional[Iterable[str]] = None):
+        self.patterns: List[Pattern] = [
+            pattern for pattern in map(compile_pattern, patterns) if pattern
+        ]
+        self._regexes = [
+            re.compile(pattern.regex) for pattern in self.patterns
+        ]
+        self._any = re.compile('|'.join(
+            f'(?:{pattern.regex})'
+            for pattern in self.patterns)) if self.patterns else None
+        self.min_size = min_size
+        self.max_size = max_size
+        self.newer_than = newer_than
+        self.older_than = older_than
+        self.extensions = None if extensions is None else frozenset(
+            '.' + extension.lower().lstrip('.') for extension in extensions)
+        self.bounded = any(bound is not None
+                           for bound in (min_size, max_size, newer_than,
+                                         older_than, self.extensions))
+        DBG(f'Compiled filter: {len(self.patterns)} patterns')
+
+    @classmethod
+    def from_file(cls, path, **kwargs) -> 'FilterSpec':
+        """Build a FilterSpec from a gitignore-style file."""
+        with open(path) as lines:
+            return cls(list(lines), **kwargs)
+
+    def excluded(self, relative: str, is_dir: bool = False) -> bool:
+        """Return whether the patterns exclude relative itself.
+
+        Parents are not checked; walkers never descend into excluded
+        directories.
+        """
+        if self._any is None or not self._any.fullmatch(relative):
+            return False
+        for pattern, regex in zip(reversed(self.patterns),
+                                  reversed(self._regexes)):
+            if pattern.dir_only and not is_dir:
+                continue
+            if regex.fullmatch(relative):
+                return not pattern.negate
+        return False
+
+    def keep_file(self,
+                  name: str,
+                  size: Optional[int] = None,
+                  mtime: Optional[float] = None) -> bool:
+        """Return whether a file meets the size, mtime and extension bounds."""
+        if self.extensions is not None and os.path.splitext(
+                name)[1].lower() not in self.extensions:
+            return False
+        if size is not None:
+            if self.min_size is not None and size < self.min_size:
+                return False
+            if self.max_size is not None and size > self.max_size:
+                return False
+        if mtime is not None:
+            if self.newer_than is not None and mtime < self.newer_than:
+                return False
+            if self.older_than is not None and mtime > self.older_than:
+                return False
+        return True
+
+    def keep(self,
+             relative: str,
+             is_dir: bool,
+             size: Optional[int] = None,
+             mtime: Optional[float] = None) -> bool:
+        """Return whether an entry at relative is kept."""
+        if self.excluded(relative, is_dir):
+            return False
+        return is_dir or not self.bounded or self.keep_file(
+            relative.rsplit('/', 1)[-1], size, mtime)
+
+    def keep_path(self,
+                  relative: str,
+                  is_dir: bool,
+                  size: Optional[int] = None,
+                  mtime: Optional[float] = None) -> bool:
+        """Return whether a walk would reach and keep relative.
+
+        Unlike keep, the parent directories are checked as well, for
+        paths that were not found by a walk.
+        """
+        parts = relative.split('/')
+        for depth in range(1, len(parts)):
+            if self.excluded('/'.join(parts[:depth]), True):
+                return False
+        return self.keep(relative, is_dir, size, mtime)
+
+    def keep_entry(self, entry: os.DirEntry, relative: str) -> bool:
+        """Return whether a scandir entry is kept.
+
+        Files are only stat'ed when bounds are set, and DirEntry caches the
+        result for the stat stage.
+        """
+        is_dir = entry.is_dir(follow_symlinks=False)
+        if self.excluded(relative, is_dir):
+            return False
+        if is_dir or not self.bounded:
+            return True
+        st = entry.stat(follow_symlinks=False)
+        return self.keep_file(entry.name, st.st_size, st.st_mtime)
+
+    def keep_info(self, info: dict, relative: str) -> bool:
+        """Return whether an fsspec info dict is kept."""
+        mtime = info.get('mtime', info.get('LastModified'))
+        if isinstance(mtime, datetime):
+            mtime = mtime.timestamp()
+        return self.keep(relative, info.get('type') == 'directory',
+                         info.get('size'), mtime)
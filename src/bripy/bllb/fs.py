@@ -1,72 +1,171 @@
 
 from datetime import datetime
-import inspect
-from operator import methodcaller
+from fnmatch import fnmatch
 import os
 from pathlib import Path
+from stat import S_ISDIR, S_ISLNK, S_ISREG
+from typing import Callable, Iterable, Iterator, Optional
+
+from fsspec.implementations.local import LocalFileSystem
 
-from fsspec import get_fs_token_paths
 import pandas as pd
 
-from bripy.bllb.file import md5_blocks, md5_blocks_fs
+from bripy.bllb.file import DEFAULT_ALGORITHM, hash_blocks, hash_blocks_fs
+from bripy.bllb.filter import FilterSpec
+from bripy.bllb.fs_cache import get_fs
 from bripy.bllb.str import hash_utf8, multisplit
 from bripy.bllb.logging import logger, DBG
 
 
-def get_stat(path, opt_md5=True) -> dict:
+STAT_FIELDS = ('st_mode', 'st_ino', 'st_dev', 'st_nlink', 'st_uid',
+               'st_gid', 'st_size', 'st_atime', 'st_mtime', 'st_ctime',
+               'st_mtime_ns', 'st_atime_ns', 'st_ctime_ns', 'st_blocks',
+               'st_blksize', 'st_rdev')
+TIME_FIELDS = ('st_atime', 'st_mtime', 'st_ctime')
+STAT_COLUMNS = ('path', 'path_hash', 'absolute_path', 'name', 'stem',
+                'suffix', 'parent', 'is_dir', 'is_file', 'is_symlink',
+                *STAT_FIELDS, *(f'f_{key}' for key in TIME_FIELDS))
+
+
+def stat_record(path: str, st: os.stat_result) -> dict:
+    """Build a fixed-schema stat record from a path and its lstat result."""
+    name = os.path.basename(path)
+    stem, suffix = os.path.splitext(name)
+    mode = st.st_mode
+    info = {
+        'path': path,
+        'path_hash': hash_utf8(path),
+        'absolute_path': os.path.abspath(path),
+        'name': name,
+        'stem': stem,
+        'suffix': suffix,
+        'parent': os.path.dirname(path),
+        'is_dir': S_ISDIR(mode),
+        'is_file': S_ISREG(mode),
+        'is_symlink': S_ISLNK(mode),
+    }
+    for key in STAT_FIELDS:
+        # st_blocks, st_blksize and st_rdev are not available everywhere.
+        info[key] = getattr(st, key, None)
+    for key in TIME_FIELDS:
+        info[f'f_{key}'] = datetime.fromtimestamp(info[key])
+    return info
+
+
+def _add_digest(info: dict, opt_md5: bool,
+                algorithm: str = DEFAULT_ALGORITHM) -> dict:
+    if opt_md5:
+        if info['is_file']:
+            try:
+                digest = hash_blocks(info['path'], algorithm)
+                if digest is not None:
+                    set_digest(info, digest, algorithm)
+            except Exception as error:
+                logger.warning(
+                    f'Could not hash item: {info["path"]}\n{error}')
+        else:
+            DBG(f'Item is not a regular file and will not be hashed.  '
+                f'{info["path"]}')
+    return info
+
+
+def set_digest(info: dict, digest: str,
+               algorithm: str = DEFAULT_ALGORITHM) -> dict:
+    """Store digest in a record, tagged with the algorithm used.
+
+    md5 digests are also stored under the legacy ``md5`` key.
+    """
+    info['digest'] = digest
+    info['hash_algorithm'] = algorithm
+    if algorithm == 'md5':
+        info['md5'] = digest
+    return info
+
+
+def get_stat(path, opt_md5=True, algorithm=DEFAULT_ALGORITHM) -> dict:
+    """Get fixed-schema stat record for a path, optionally with a digest."""
     DBG(path)
     try:
-        path = Path(path)
-        info = dict([
-            _ for _ in inspect.getmembers(path.lstat())
-            if not _[0].startswith('_') and not inspect.isbuiltin(_[1])
-        ])
-        info.update(
-            dict([(_[0], str(_[1])) for _ in inspect.getmembers(path)
-                  if '__' not in _[0] and '<' not in str(_[1])]))
-        info.update(
-            dict([(str(_[0]), methodcaller(_[0])(path))
-                  for _ in inspect.getmembers(path)
-                  if _[0].startswith('is_') and _[0] != 'is_mount']))
-        info['path'] = str(path)
-        info['path_hash'] = hash_utf8(str(path))
-        info['absolute_path'] = str(path.resolve())
-        f_times = dict()
-        for key, value in info.items():
-            if key[-4:] == 'time':
-                f_times[f'f_{key}'] = datetime.fromtimestamp(value)
-        info.update(f_times)
-        if opt_md5:
-            if not path.is_dir():
-                try:
-                    md5_hash = md5_blocks(path)
-                    info['md5'] = md5_hash
-                except Exception as error:
-                    logger.warning(f'Could not hash item: {str(path)}\n{error}')
-            else:
-                DBG(
-                    f'Item is a directory and will not be hashed.  {str(path)}'
-                )
-        return info
+        path = str(path)
+        return _add_digest(stat_record(path, os.lstat(path)), opt_md5,
+                           algorithm)
     except Exception as error:
         logger.warning(error)
         return {'path': str(path)}
 
 
-def get_stat_fs(path, opt_md5=False) -> dict:
+def get_entry_stat(entry: os.DirEntry,
+                   opt_md5=False,
+                   algorithm=DEFAULT_ALGORITHM) -> dict:
+    """Get fixed-schema stat record from an ``os.scandir`` entry.
+
+    Reuses the stat data cached on the entry, so at most one lstat is made.
+    """
+    try:
+        return _add_digest(
+            stat_record(entry.path, entry.stat(follow_symlinks=False)),
+            opt_md5, algorithm)
+    except Exception as error:
+        logger.warning(error)
+        return {'path': entry.path}
+
+
+def walk_entries(path,
+                 spec: Optional[FilterSpec] = None) -> Iterator[os.DirEntry]:
+    """Yield ``os.scandir`` entries below path without following symlinks.
+
+    Entries rejected by spec are skipped and never descended into.
+    """
+    stack = [(str(path), '')]
+    while stack:
+        directory, prefix = stack.pop()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    relative = prefix + entry.name
+                    if spec is not None and not spec.keep_entry(
+                            entry, relative):
+                        continue
+                    yield entry
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append((entry.path, relative + '/'))
+        except OSError as error:
+            logger.warning(f'Could not list directory: {directory}\n{error}')
+
+
+def scan_stat(path, opt_md5=False, algorithm=DEFAULT_ALGORITHM,
+              spec: Optional[FilterSpec] = None) -> Iterator[dict]:
+    """Yield fixed-schema stat records for everything below path."""
+    for entry in walk_entries(path, spec):
+        yield get_entry_stat(entry, opt_md5, algorithm)
+
+
+def get_stat_fs(path, opt_md5=False, algorithm=DEFAULT_ALGORITHM,
+                fs=None, info=None) -> dict:
+    """Stat path on any fsspec filesystem.
+
+    Pass the info dict from a detailed listing (ls_info, find_info) to skip
+    the per-entry fs.info request.
+    """
     DBG(path)
-    fs, token, paths = get_fs_token_paths(path)
+    if fs is None:
+        fs, _ = get_fs(path)
     protocol = get_protocol(fs)
-    info = fs.info(path)
+    if info is None:
+        info = fs.info(path)
+    else:
+        info = dict(info, name=fs._strip_protocol(info['name']))
+    listed = dict(info)
     info.update({"protocol": protocol})
-    info.update({"created": pd.to_datetime(info["created"], unit="s")})
-    info.update({"mtime": pd.to_datetime(info["mtime"], unit="s")})
+    info.update({"created": pd.to_datetime(info.get("created"), unit="s")})
+    info.update({"mtime": pd.to_datetime(info.get("mtime"), unit="s")})
     info.update({"words": set(multisplit(path))})
     if opt_md5:
-        if not fs.isdir(path):
+        if info.get("type") != "directory":
             try:
-                md5_hash = md5_blocks_fs(path)
-                info['md5'] = md5_hash
+                digest = hash_blocks_fs(path, algorithm, fs=fs, info=listed)
+                if digest is not None:
+                    set_digest(info, digest, algorithm)
             except Exception as error:
                 logger.warning(f'Could not hash item: {str(path)}\n{error}')
         else:
@@ -76,10 +175,14 @@ def get_stat_fs(path, opt_md5=False) -> dict:
     return info
 
 
-def glob_paths(path, glob="*"):
+def glob_paths(path, glob="*", spec: Optional[FilterSpec] = None):
     try:
         path = Path(path)
         if path.is_dir():
+            if spec is not None:
+                return (Path(entry.path)
+                        for entry in walk_entries(path, spec)
+                        if fnmatch(entry.name, glob))
             return path.rglob(glob)
         else:
             return path
@@ -87,41 +190,161 @@ def glob_paths(path, glob="*"):
         logger.warning(error)
 
 
-def rglob(path):
+def rglob(path, fs=None, spec: Optional[FilterSpec] = None):
     try:
-        fs, token, paths = get_fs_token_paths(path)
-        protocol = get_protocol(fs)
+        if fs is None:
+            fs, _ = get_fs(path)
         if fs.isdir(path):
-            return (f"{protocol}://{_}" for _ in fs.glob(Path(path)/'**'))
+            return walk_fs(path, withdirs=True, spec=spec, fs=fs)
         return path
     except Exception as error:
         logger.warning(error)
 
 
-def get_dir(d, glob="*"):
+def get_dir(d, glob="*", spec: Optional[FilterSpec] = None):
     path = Path(d)
     if path.is_dir():
+        if spec is not None:
+            return (Path(entry.path) for entry in os.scandir(path)
+                    if fnmatch(entry.name, glob)
+                    and spec.keep_entry(entry, entry.name))
         return path.glob(glob)
 
 
-def get_dir_fs(d, glob="*"):
-    fs, token, paths = get_fs_token_paths(d)
+def get_dir_fs(d, glob="*", fs=None, spec: Optional[FilterSpec] = None):
+    if fs is None:
+        fs, _ = get_fs(d)
     protocol = get_protocol(fs)
     if fs.isdir(d):
+        if spec is not None:
+            found = fs.glob(f"{d}/{glob}", detail=True).values()
+            return [
+                f"{protocol}://{info['name']}" for info in found
+                if spec.keep_info(info, info['name'].rstrip('/').rsplit(
+                    '/', 1)[-1])
+            ]
         return [f"{protocol}://{_}" for _ in fs.glob(f"{d}/{glob}")]
     else:
         return []
 
 
+def ls_info(d, fs=None) -> list:
+    """List directory d with one request, returning full info dicts.
+
+    Each ``name`` is set to the entry URL.
+    """
+    if fs is None:
+        fs, d = get_fs(d)
+    protocol = get_protocol(fs)
+    entries = fs.ls(fs._strip_protocol(d), detail=True)
+    for info in entries:
+        info['name'] = f"{protocol}://{info['name']}"
+    return entries
+
+
+def find_info(path, fs=None, withdirs=False) -> list:
+    """Recursively list path, returning full info dicts.
+
+    Uses ``fs.find(detail=True)``, which costs one request per directory
+    (or one in total on object stores) instead of one per entry.  Each
+    ``name`` is set to the entry URL.
+    """
+    if fs is None:
+        fs, path = get_fs(path)
+    protocol = get_protocol(fs)
+    found = fs.find(fs._strip_protocol(path), withdirs=withdirs,
+                    detail=True)
+    infos = list(found.values())
+    for info in infos:
+        info['name'] = f"{protocol}://{info['name']}"
+    return infos
+
+
+def _excluded(name: str, relative: str, exclude: Iterable[str]) -> bool:
+    return any(
+        fnmatch(name, pattern) or fnmatch(relative, pattern)
+        for pattern in exclude)
+
+
+def walk_fs(path,
+            maxdepth: Optional[int] = None,
+            withdirs: bool = False,
+            detail: bool = False,
+            exclude: Iterable[str] = (),
+            skip_hidden: bool = False,
+            skip_mounts: bool = False,
+            prune: Optional[Callable[[dict], bool]] = None,
+            spec: Optional[FilterSpec] = None,
+            fs=None) -> Iterator:
+    """Lazily walk path depth-first on any fsspec filesystem.
+
+    Only the pending directory stack and one listing are held in memory, and
+    entries are yielded as soon as their directory is listed.  Yields entry
+    URLs, or info dicts with URL names if detail is set.  Directories are
+    only yielded if withdirs is set.
+
+    Entries are skipped, and directories not descended into, when their
+    name or path relative to path matches an exclude glob, when they are
+    hidden and skip_hidden is set, when prune(info) is true, when spec
+    rejects them, or when they are mount points (local filesystems only)
+    and skip_mounts is set.
+    maxdepth 1 lists only path itself.
+    """
+    if fs is None:
+        fs, _ = get_fs(path)
+    prefix = f"{get_protocol(fs)}://"
+    root = fs._strip_protocol(path)
+    root = root.rstrip('/') or root
+    start = len(root.rstrip('/')) + 1
+    exclude = tuple(exclude)
+    mounts = skip_mounts and isinstance(fs, LocalFileSystem)
+    stack = [(root, 1)]
+    while stack:
+        directory, depth = stack.pop()
+        try:
+            entries = fs.ls(directory, detail=True)
+        except Exception as error:
+            logger.warning(f'Could not list directory: {directory}\n{error}')
+            continue
+        subdirs = []
+        for info in entries:
+            name = info['name'].rstrip('/')
+            if name == directory:
+                continue
+            basename = name.rsplit('/', 1)[-1]
+            relative = name[start:]
+            is_dir = info['type'] == 'directory'
+            if ((skip_hidden and basename.startswith('.'))
+                    or (exclude and _excluded(basename, relative, exclude))
+                    or (spec is not None
+                        and not spec.keep_info(info, relative))
+                    or (prune is not None and prune(info))
+                    or (is_dir and mounts and os.path.ismount(name))):
+                continue
+            if is_dir:
+                if maxdepth is None or depth < maxdepth:
+                    subdirs.append(name)
+                if not withdirs:
+                    continue
+            if detail:
+                info['name'] = prefix + name
+                yield info
+            else:
+                yield prefix + name
+        stack.extend((subdir, depth + 1) for subdir in reversed(subdirs))
+
+
 def get_protocol(fs):
     return fs.protocol if isinstance(fs.protocol, str) else fs.protocol[0]
 
 
-def is_dir(path):
-    fs, token, paths = get_fs_token_paths(path)
+def is_dir(path, fs=None):
+    if fs is None:
+        fs, _ = get_fs(path)
     return fs.isdir(path)
 
 
-def is_file(path):
-    fs, token, paths = get_fs_token_paths(path)
+def is_file(path, fs=None):
+    if fs is None:
+        fs, _ = get_fs(path)
     return fs.isfile(path)
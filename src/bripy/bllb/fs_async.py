@@ -0,0 +1,216 @@
+"""Concurrent inventory and hashing on async fsspec filesystems.
+
+Remote backends spend most of their time waiting on round trips, so
+listing, ``_info`` and ranged ``_cat_file`` requests are issued
+concurrently on the filesystem's event loop, bounded by a semaphore.
+Synchronous filesystems are wrapped so the same code path runs anywhere.
+"""
+import asyncio
+from typing import Awaitable, Callable, Iterable, List, Optional
+
+from fsspec.asyn import AsyncFileSystem, sync
+
+from bripy.bllb.file import (BLOCKSIZE, DEFAULT_ALGORITHM, get_hash_cache,
+                             get_hasher)
+from bripy.bllb.fs import get_protocol, get_stat_fs, set_digest
+from bripy.bllb.fs_cache import get_fs
+from bripy.bllb.logging import logger, DBG
+from bripy.bllb.q import STOP
+
+__all__ = [
+    'as_async', 'hash_file_async', 'stat_async', 'walk_async',
+    'inventory_async', 'inventory', 'hash_paths'
+]
+
+CONCURRENCY = 64
+READAHEAD = 4
+
+
+def as_async(fs) -> AsyncFileSystem:
+    """Return fs, wrapped in an async filesystem if it is synchronous."""
+    if fs.async_impl:
+        return fs
+    from fsspec.implementations.asyn_wrapper import AsyncFileSystemWrapper
+    return AsyncFileSystemWrapper(fs)
+
+
+async def hash_file_async(fs: AsyncFileSystem,
+                          path: str,
+                          semaphore: asyncio.Semaphore,
+                          algorithm: str = DEFAULT_ALGORITHM,
+                          blocksize: int = BLOCKSIZE,
+                          size: Optional[int] = None) -> str:
+    """Hash path with ranged reads, READAHEAD ranges in flight at a time."""
+    hasher = get_hasher(algorithm)
+    if size is None:
+        async with semaphore:
+            size = (await fs._info(path))['size']
+
+    async def read(start):
+        async with semaphore:
+            return await fs._cat_file(path,
+                                      start=start,
+                                      end=min(start + blocksize, size))
+
+    starts = range(0, size, blocksize)
+    for index in range(0, len(starts), READAHEAD):
+        window = starts[index:index + READAHEAD]
+        for block in await asyncio.gather(*map(read, window)):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+async def stat_async(fs: AsyncFileSystem,
+                     path: str,
+                     semaphore: asyncio.Semaphore,
+                     opt_md5: bool = False,
+                     algorithm: str = DEFAULT_ALGORITHM,
+                     info: Optional[dict] = None) -> dict:
+    """Async counterpart of get_stat_fs, consulting the active hash cache."""
+    if info is None:
+        async with semaphore:
+            info = await fs._info(path)
+    record = get_stat_fs(path,
+                         False,
+                         fs=getattr(fs, 'sync_fs', fs),
+                         info=info)
+    if opt_md5 and info.get('type') != 'directory':
+        cache = get_hash_cache()
+        protocol = get_protocol(fs)
+        try:
+            digest = None if cache is None else cache.get_remote(
+                protocol, path, info, algorithm)
+            if digest is None:
+                digest = await hash_file_async(fs, path, semaphore,
+                                               algorithm,
+                                               size=info.get('size'))
+                if cache is not None:
+                    cache.put_remote(protocol, path, info, algorithm, digest)
+            set_digest(record, digest, algorithm)
+        except Exception as error:
+            logger.warning(f'Could not hash item: {str(path)}\n{error}')
+    return record
+
+
+async def _walk(fs: AsyncFileSystem, path: str,
+                semaphore: asyncio.Semaphore,
+                put: Callable[[dict], Awaitable]):
+    """Pass the info of every file below path to put as it is listed."""
+
+    async def visit(d):
+        try:
+            async with semaphore:
+                entries = await fs._ls(d, detail=True)
+        except Exception as error:
+            logger.warning(f'Could not list directory: {d}\n{error}')
+            return
+        subdirs = []
+        for info in entries:
+            if info['name'].rstrip('/') == d.rstrip('/'):
+                continue
+            if info['type'] == 'directory':
+                subdirs.append(info['name'])
+            else:
+                await put(info)
+        await asyncio.gather(*map(visit, subdirs))
+
+    await visit(path)
+
+
+async def walk_async(fs: AsyncFileSystem, path: str,
+                     semaphore: asyncio.Semaphore) -> List[dict]:
+    """List every file below path, all directories of a level at once."""
+    files = []
+
+    async def put(info):
+        files.append(info)
+
+    await _walk(fs, path, semaphore, put)
+    DBG(f'Listed {len(files)} files below {path}')
+    return files
+
+
+async def inventory_async(fs: AsyncFileSystem,
+                          path: str,
+                          opt_md5: bool = False,
+                          algorithm: str = DEFAULT_ALGORITHM,
+                          concurrency: int = CONCURRENCY) -> List[dict]:
+    """Walk and stat path with at most concurrency requests in flight.
+
+    Listed files stream through a bounded queue to concurrency workers, so
+    a slow stat or hash stage holds back the walk instead of the pending
+    work growing with the tree.  Records are returned in completion order.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    q = asyncio.Queue(2 * concurrency)
+    records = []
+
+    async def work():
+        while True:
+            info = await q.get()
+            if info is STOP:
+                return
+            records.append(await stat_async(fs, info['name'], semaphore,
+                                            opt_md5, algorithm, info))
+
+    workers = [asyncio.ensure_future(work()) for _ in range(concurrency)]
+    try:
+        await _walk(fs, path, semaphore, q.put)
+        for _ in workers:
+            await q.put(STOP)
+        await asyncio.gather(*workers)
+    finally:
+        for worker in workers:
+            worker.cancel()
+    DBG(f'Inventoried {len(records)} files below {path}')
+    return records
+
+
+def inventory(path,
+              opt_md5: bool = False,
+              algorithm: str = DEFAULT_ALGORITHM,
+              concurrency: int = CONCURRENCY,
+              fs=None) -> List[dict]:
+    """Return get_stat_fs records for every file below path.
+
+    Runs on the event loop of fs (resolved from path if not given).
+    """
+    if fs is None:
+        fs, path = get_fs(path)
+    fs = as_async(fs)
+    protocol = get_protocol(fs)
+    DBG(f'Async inventory of {protocol}://{path}')
+    return sync(fs.loop, inventory_async, fs, fs._strip_protocol(path),
+                opt_md5, algorithm, concurrency)
+
+
+def hash_paths(paths: Iterable[str],
+               algorithm: str = DEFAULT_ALGORITHM,
+               concurrency: int = CONCURRENCY,
+               fs=None) -> List[Optional[str]]:
+    """Hash paths concurrently, returning digests in order.
+
+    Paths that can not be hashed get None.
+    """
+    paths = list(paths)
+    if not paths:
+        return []
+    if fs is None:
+        fs, _ = get_fs(paths[0])
+    fs = as_async(fs)
+
+    async def run():
+        semaphore = asyncio.Semaphore(concurrency)
+        results = await asyncio.gather(*(hash_file_async(
+            fs, fs._strip_protocol(path), semaphore, algorithm)
+                                         for path in paths),
+                                       return_exceptions=True)
+        digests = []
+        for path, result in zip(paths, results):
+            if isinstance(result, Exception):
+                logger.warning(f'Could not hash item: {path}\n{result}')
+                result = None
+            digests.append(result)
+        return digests
+
+    return sync(fs.loop, run)
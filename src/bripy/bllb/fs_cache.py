@@ -0,0 +1,58 @@
+"""Cached fsspec filesystem resolution.
+
+``get_fs_token_paths`` parses the URL, looks up the implementation and
+builds a token on every call.  get_fs keeps one filesystem instance per
+protocol and storage options, so hot paths pay for resolution only once.
+"""
+from functools import lru_cache
+from typing import Tuple
+
+from fsspec import (AbstractFileSystem, filesystem, get_filesystem_class,
+                    get_fs_token_paths)
+from fsspec.core import split_protocol
+
+from bripy.bllb.logging import DBG
+
+__all__ = ['get_fs', 'get_filesystem', 'clear_fs_cache']
+
+DEFAULT_PROTOCOL = 'file'
+
+
+@lru_cache(maxsize=None)
+def _filesystem(protocol: str, options: tuple) -> AbstractFileSystem:
+    DBG(f'Resolving filesystem: {protocol} {options}')
+    return filesystem(protocol, **dict(options))
+
+
+def get_filesystem(protocol: str = DEFAULT_PROTOCOL,
+                   **storage_options) -> AbstractFileSystem:
+    """Return the cached filesystem for protocol and storage options."""
+    try:
+        return _filesystem(protocol, tuple(sorted(storage_options.items())))
+    except TypeError:
+        # Unhashable storage options can not be cached.
+        return filesystem(protocol, **storage_options)
+
+
+def get_fs(path: str, **storage_options) -> Tuple[AbstractFileSystem, str]:
+    """Return the cached filesystem for path and the path it uses.
+
+    Options encoded in the URL (host, port, user, ...) are merged under
+    storage_options, so they are part of the cache key.  Chained URLs
+    (``a::b://``) are resolved by fsspec without caching.
+    """
+    path = str(path)
+    if '::' in path:
+        fs, token, paths = get_fs_token_paths(path,
+                                              storage_options=storage_options)
+        return fs, paths[0]
+    protocol = split_protocol(path)[0] or DEFAULT_PROTOCOL
+    cls = get_filesystem_class(protocol)
+    options = {**cls._get_kwargs_from_urls(path), **storage_options}
+    fs = get_filesystem(protocol, **options)
+    return fs, fs._strip_protocol(path)
+
+
+def clear_fs_cache():
+    """Forget all cached filesystems."""
+    _filesystem.cache_clear()
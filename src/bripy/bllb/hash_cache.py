@@ -0,0 +1,164 @@
+"""Persistent content hash cache.
+
+Digests are stored in SQLite keyed by (st_dev, st_ino, st_size,
+st_mtime_ns) for local files and (protocol, path, version, size) for
+fsspec files, where version is the ETag or modification time reported by
+the filesystem.  Hashing an unchanged tree a second time then costs one
+stat and one indexed lookup per file and no content reads.
+
+The cache is safe to share between threads, and between processes through
+the same database file; a forked child reopens its own connection.
+"""
+from functools import lru_cache
+import os
+import sqlite3
+from threading import Lock
+from typing import Optional
+
+from bripy.bllb.logging import DBG
+
+__all__ = ['HashCache', 'open_hash_cache', 'info_version', 'DEFAULT_CACHE']
+
+DEFAULT_CACHE = os.path.join(os.path.expanduser('~'), '.cache', 'bripy',
+                             'hashes.db')
+COMMIT_EVERY = 1000
+TIMEOUT = 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS local (
+    st_dev INTEGER NOT NULL,
+    st_ino INTEGER NOT NULL,
+    st_size INTEGER NOT NULL,
+    st_mtime_ns INTEGER NOT NULL,
+    algorithm TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    PRIMARY KEY (st_dev, st_ino, st_size, st_mtime_ns, algorithm)
+);
+CREATE TABLE IF NOT EXISTS remote (
+    protocol TEXT NOT NULL,
+    path TEXT NOT NULL,
+    version TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    algorithm TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    PRIMARY KEY (protocol, path, version, size, algorithm)
+);
+"""
+
+
+def info_version(info: dict) -> Optional[str]:
+    """Return the ETag or modification time of an fsspec info dict."""
+    for key in ('ETag', 'etag', 'md5Hash', 'mtime', 'LastModified',
+                'last_modified', 'updated'):
+        if info.get(key) is not None:
+            return str(info[key])
+    return None
+
+
+class HashCache:
+    """SQLite-backed digest cache for local and fsspec files."""
+
+    def __init__(self, database=DEFAULT_CACHE):
+        self.database = str(database)
+        directory = os.path.dirname(os.path.abspath(self.database))
+        os.makedirs(directory, exist_ok=True)
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self._connection = None
+        self._pid = None
+        self._pending = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        if self._pid != os.getpid():
+            DBG(f'Opening hash cache: {self.database}')
+            self._connection = sqlite3.connect(self.database,
+                                               timeout=TIMEOUT,
+                                               check_same_thread=False)
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.executescript(SCHEMA)
+            self._pid = os.getpid()
+            self._pending = 0
+        return self._connection
+
+    def _get(self, statement: str, params: tuple) -> Optional[str]:
+        with self.lock:
+            row = self.connection.execute(statement, params).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return row[0]
+
+    def _put(self, statement: str, params: tuple):
+        with self.lock:
+            self.connection.execute(statement, params)
+            self._pending += 1
+            if self._pending >= COMMIT_EVERY:
+                self.connection.commit()
+                self._pending = 0
+
+    def get(self, st: os.stat_result, algorithm: str) -> Optional[str]:
+        """Return the cached digest of a local file by its stat result."""
+        return self._get(
+            'SELECT digest FROM local WHERE st_dev = ? AND st_ino = ? '
+            'AND st_size = ? AND st_mtime_ns = ? AND algorithm = ?',
+            (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns, algorithm))
+
+    def put(self, st: os.stat_result, algorithm: str, digest: str):
+        """Store the digest of a local file."""
+        self._put(
+            'INSERT OR REPLACE INTO local VALUES (?, ?, ?, ?, ?, ?)',
+            (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns, algorithm,
+             digest))
+
+    def get_remote(self, protocol: str, path: str, info: dict,
+                   algorithm: str) -> Optional[str]:
+        """Return the cached digest of an fsspec file by its info dict."""
+        version = info_version(info)
+        if version is None:
+            return None
+        return self._get(
+            'SELECT digest FROM remote WHERE protocol = ? AND path = ? '
+            'AND version = ? AND size = ? AND algorithm = ?',
+            (protocol, path, version, info.get('size') or 0, algorithm))
+
+    def put_remote(self, protocol: str, path: str, info: dict,
+                   algorithm: str, digest: str):
+        """Store the digest of an fsspec file."""
+        version = info_version(info)
+        if version is None:
+            return
+        self._put(
+            'INSERT OR REPLACE INTO remote VALUES (?, ?, ?, ?, ?, ?)',
+            (protocol, path, version, info.get('size') or 0, algorithm,
+             digest))
+
+    def commit(self):
+        """Commit stored digests, releasing the write lock."""
+        with self.lock:
+            if self._pid == os.getpid() and self._pending:
+                self._connection.commit()
+                self._pending = 0
+
+    def close(self):
+        """Commit and close this process's connection."""
+        self.commit()
+        with self.lock:
+            if self._pid == os.getpid():
+                self._connection.close()
+            self._connection = None
+            self._pid = None
+
+
+@lru_cache(maxsize=None)
+def open_hash_cache(database=DEFAULT_CACHE) -> HashCache:
+    """Return one shared HashCache per database in this process."""
+    return HashCache(database)
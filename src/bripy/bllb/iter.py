@@ -1,8 +1,9 @@
 """bllb iterator helpers."""
 from functools import reduce
+from itertools import islice
 from operator import iconcat
 from pprint import pprint
-from typing import Any, Callable, Iterable, List
+from typing import Any, Callable, Iterable, Iterator, List
 
 from bripy.bllb.logging import logger, DBG
 
@@ -24,6 +25,15 @@ def reduce_iconcat(a: Iterable[Any]) -> List[Any]:
 cat: Callable[[Iterable[str]], str] = "".join
 
 
+def chunks(iterable: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    """Yield successive lists of up to size items."""
+    it = iter(iterable)
+    chunk = list(islice(it, size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(it, size))
+
+
 def striter(iterable: Iterable[Any], item_delim: str = "\n",
             list_delim: str = "\n") -> str:
     """Concatenate items in an iterable into a string."""
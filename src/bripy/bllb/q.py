@@ -1,27 +1,118 @@
-from queue import Queue
-from threading import Thread
-from time import sleep
+"""Queue helpers for threaded and multiprocess pipelines.
 
+Producers end a stream by putting STOP on the queue, once per producer.
+STOP pickles by reference, so ``item is STOP`` holds across
+multiprocessing queues as well.  A producer that fails puts a failure
+item instead, which drain re-raises, so consumers never mistake a
+truncated stream for a finished one.
+
+The batch helpers move tuples of items through bounded queues, paying one
+lock round trip per batch instead of per item, and end on STOP.  Pipeline
+chains them into staged thread, process or asyncio workers.
+"""
+import asyncio
+from itertools import chain
+from multiprocessing import get_context
+import pickle
+from queue import Empty, Full, Queue
+from threading import Event, Lock, Thread
+from time import perf_counter
+from typing import (AsyncIterator, Callable, Dict, Iterable, Iterator, List,
+                    Optional, Sequence, Set, Tuple)
+
+from bripy.bllb.iter import chunks
 from bripy.bllb.logging import logger, DBG
 
+POLL = 0.01
+BATCH_SIZE = 1024
+MAXSIZE = 16
+
+
+class _Stop:
+    """End of stream sentinel."""
+
+    def __repr__(self):
+        return 'STOP'
+
+    def __reduce__(self):
+        return 'STOP'
+
+
+STOP = _Stop()
+
+
+class _Failure:
+    """An error passed downstream in place of the rest of a stream."""
+
+    def __init__(self, error: BaseException):
+        try:
+            pickle.dumps(error)
+        except Exception:
+            error = RuntimeError(repr(error))
+        self.error = error
+
+
+def put_stop(q, n=1):
+    """Put n STOP sentinels on q, one per consumer."""
+    for _ in range(n):
+        q.put(STOP)
+
+
+def drain(q,
+          sentinels: int = 1,
+          done: Optional[Callable[[], bool]] = None,
+          timeout: Optional[float] = None,
+          poll: float = POLL) -> Iterator:
+    """Yield items from q as they arrive, blocking while it is empty.
+
+    Stops after sentinels STOP items (one per producer), or, if done is
+    given, once done() is true and q is empty; done is typically a check
+    of a shared completion counter.  Without done, get blocks until the
+    next item; with done, it wakes every poll seconds to check it.  Gives
+    up with a warning after timeout seconds without an item.  Calls
+    task_done for every item taken from a joinable queue.  Re-raises the
+    error of a failed producer.
+    """
+    task_done = getattr(q, 'task_done', None)
+    stops = 0
+    idle = 0.0
+    finishing = False
+    while True:
+        if done is not None and not finishing and done():
+            finishing = True
+        try:
+            item = q.get(timeout=timeout if done is None else poll)
+        except Empty:
+            if finishing:
+                return
+            idle += poll
+            if done is None or (timeout is not None and idle >= timeout):
+                logger.warning(f'Queue drain timed out after {timeout}s.')
+                return
+            continue
+        idle = 0.0
+        if task_done is not None:
+            task_done()
+        if isinstance(item, _Failure):
+            raise item.error
+        if item is STOP:
+            stops += 1
+            DBG(f'Queue drain: {stops} of {sentinels} sentinels')
+            if stops >= sentinels:
+                return
+            continue
+        yield item
+
+
 def unloadq(q, stop, limit=2000, rest=.1, check=100):
-    i = limit
-    loops = 0
-    results = []
-    while True and ((i and not stop()) or q.qsize()):
-        loops += 1
-        if loops % check == 0:
-            DBG(i, loops, len(results))
-        if q.qsize():
-            x = q.get()
-            DBG(x)
-            results.append(x)
-            i = min(i + 1, limit)
-        else:
-            i -= 1
-            if i % check == 0:
-                DBG(i)
-            sleep(rest)
+    """Collect items from q until stop() is true and q is empty.
+
+    Blocks on q instead of sleeping, so it returns as soon as the last item
+    is taken.  Gives up after limit * rest seconds without an item; check
+    is kept for compatibility.
+    """
+    results = list(drain(q, done=stop, timeout=limit * rest, poll=POLL))
+    DBG(f'unloadq: {len(results)} results')
     return results
 
 
@@ -63,6 +154,248 @@ def merge(*in_qs, **kwargs):
     return out_q
 
 
+def get_batch(q, size: int = BATCH_SIZE,
+              timeout: Optional[float] = None) -> list:
+    """Block for one item of q, then take up to size - 1 more waiting ones.
+
+    A batch ends after a STOP or failure item, so whatever follows it stays
+    on q.
+    """
+    items = [q.get(timeout=timeout)]
+    while len(items) < size and not _ends(items[-1]):
+        try:
+            items.append(q.get_nowait())
+        except Empty:
+            break
+    return items
+
+
+def _ends(item) -> bool:
+    return item is STOP or isinstance(item, _Failure)
+
+
+def put_batches(q, iterable: Iterable, size: int = BATCH_SIZE, stop=True):
+    """Put iterable on q as tuples of up to size items, then STOP."""
+    for batch in chunks(iterable, size):
+        q.put(tuple(batch))
+    if stop:
+        put_stop(q)
+
+
+def iter_batches(q, sentinels: int = 1) -> Iterator:
+    """Yield the items of the batches on q until sentinels STOPs."""
+    for batch in drain(q, sentinels):
+        yield from batch
+
+
+def _start(target, *args, name=None) -> Thread:
+    thread = Thread(target=target, args=args, name=name, daemon=True)
+    thread.start()
+    return thread
+
+
+def rebatch(q,
+            size: int = BATCH_SIZE,
+            maxsize: int = MAXSIZE,
+            sentinels: int = 1) -> Queue:
+    """Collect the items of q into batches on a bounded queue.
+
+    Batches are tuples of up to size items, taken as soon as they are
+    waiting rather than filled.  The returned queue holds at most maxsize
+    batches, so a slow consumer blocks this thread instead of growing
+    memory.  The thread ends, and puts STOP, after sentinels STOPs on q;
+    an error, including a failure item on q, is passed on instead.
+    """
+    out_q = Queue(maxsize)
+
+    def f():
+        stops = 0
+        try:
+            while stops < sentinels:
+                batch = get_batch(q, size)
+                if isinstance(batch[-1], _Failure):
+                    raise batch[-1].error
+                if batch[-1] is STOP:
+                    stops += 1
+                    batch.pop()
+                if batch:
+                    out_q.put(tuple(batch))
+        except Exception as error:
+            logger.error(f'rebatch failed: {error}')
+            out_q.put(_Failure(error))
+        else:
+            put_stop(out_q)
+
+    _start(f, name='rebatch')
+    return out_q
+
+
+def multiplex_batches(n, q, maxsize: int = MAXSIZE) -> List[Queue]:
+    """Copy every batch of q to n bounded queues.
+
+    Batches are shared between the outputs, so they must not be mutated.
+    The slowest consumer sets the pace.  STOP on q, or an error, is passed
+    to every output and ends the thread.
+
+    >>> q1, q2, q3 = multiplex_batches(3, in_q)
+    """
+    out_queues = [Queue(maxsize) for i in range(n)]
+
+    def f():
+        try:
+            for batch in drain(q):
+                for out_q in out_queues:
+                    out_q.put(batch)
+        except Exception as error:
+            logger.error(f'multiplex failed: {error}')
+            end = _Failure(error)
+        else:
+            end = STOP
+        for out_q in out_queues:
+            out_q.put(end)
+
+    _start(f, name='multiplex')
+    return out_queues
+
+
+def merge_batches(*in_qs, maxsize: int = MAXSIZE) -> Queue:
+    """Merge the batches of several queues into one bounded queue.
+
+    Puts a single STOP once every input has sent STOP.  An error on any
+    input is passed on as soon as it happens.
+
+    >>> out_q = merge_batches(q1, q2, q3)
+    """
+    out_q = Queue(maxsize)
+    remaining = [len(in_qs)]
+    lock = Lock()
+
+    def f(in_q):
+        try:
+            for batch in drain(in_q):
+                out_q.put(batch)
+        except Exception as error:
+            logger.error(f'merge failed: {error}')
+            out_q.put(_Failure(error))
+        finally:
+            with lock:
+                remaining[0] -= 1
+                last = not remaining[0]
+            if last:
+                put_stop(out_q)
+
+    for in_q in in_qs:
+        _start(f, in_q, name='merge')
+    return out_q
+
+
+_tasks: Set[asyncio.Task] = set()
+
+
+def _spawn(coroutine) -> asyncio.Task:
+    """Start a task and keep it referenced until it finishes."""
+    task = asyncio.ensure_future(coroutine)
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+    return task
+
+
+async def drain_async(q: asyncio.Queue, sentinels: int = 1) -> AsyncIterator:
+    """Yield items from an asyncio queue until sentinels STOPs.
+
+    Re-raises the error of a failed producer.
+    """
+    stops = 0
+    while True:
+        item = await q.get()
+        q.task_done()
+        if isinstance(item, _Failure):
+            raise item.error
+        if item is STOP:
+            stops += 1
+            if stops >= sentinels:
+                return
+            continue
+        yield item
+
+
+async def get_batch_async(q: asyncio.Queue, size: int = BATCH_SIZE) -> list:
+    """Wait for one item of q, then take up to size - 1 more waiting ones.
+
+    A batch ends after a STOP or failure item.
+    """
+    items = [await q.get()]
+    q.task_done()
+    while len(items) < size and not q.empty() and not _ends(items[-1]):
+        items.append(q.get_nowait())
+        q.task_done()
+    return items
+
+
+async def put_batches_async(q: asyncio.Queue,
+                            iterable: Iterable,
+                            size: int = BATCH_SIZE,
+                            stop=True):
+    """Put iterable on q as tuples of up to size items, then STOP."""
+    for batch in chunks(iterable, size):
+        await q.put(tuple(batch))
+    if stop:
+        await q.put(STOP)
+
+
+async def iter_batches_async(q: asyncio.Queue,
+                             sentinels: int = 1) -> AsyncIterator:
+    """Yield the items of the batches on q until sentinels STOPs."""
+    async for batch in drain_async(q, sentinels):
+        for item in batch:
+            yield item
+
+
+def multiplex_async(n, q: asyncio.Queue,
+                    maxsize: int = MAXSIZE) -> List[asyncio.Queue]:
+    """asyncio counterpart of multiplex_batches, run in a task."""
+    out_queues = [asyncio.Queue(maxsize) for i in range(n)]
+
+    async def f():
+        try:
+            async for batch in drain_async(q):
+                for out_q in out_queues:
+                    await out_q.put(batch)
+        except Exception as error:
+            logger.error(f'multiplex failed: {error}')
+            end = _Failure(error)
+        else:
+            end = STOP
+        for out_q in out_queues:
+            await out_q.put(end)
+
+    _spawn(f())
+    return out_queues
+
+
+def merge_async(*in_qs: asyncio.Queue,
+                maxsize: int = MAXSIZE) -> asyncio.Queue:
+    """asyncio counterpart of merge_batches, run in one task per input."""
+    out_q = asyncio.Queue(maxsize)
+    remaining = [len(in_qs)]
+
+    async def f(in_q):
+        try:
+            async for batch in drain_async(in_q):
+                await out_q.put(batch)
+        except Exception as error:
+            logger.error(f'merge failed: {error}')
+            await out_q.put(_Failure(error))
+        finally:
+            remaining[0] -= 1
+            if not remaining[0]:
+                await out_q.put(STOP)
+
+    for in_q in in_qs:
+        _spawn(f(in_q))
+    return out_q
+
+
 def iterq(q):
     while q.qsize():
         yield q.get()
@@ -72,7 +405,7 @@ def get_q(q):
     results = []
     while not q.empty() or q.qsize():
         item = q.get()
-        if item == 'STOP':
+        if item is STOP or item == 'STOP':
             DBG('STOP get_q')
             q.task_done()
             break
@@ -81,3 +414,506 @@ def get_q(q):
             results.append(item)
         q.task_done()
     return results
+
+
+KINDS = ('thread', 'process', 'asyncio', 'stream')
+
+
+class PipelineError(Exception):
+    """A pipeline stage failed; the original error is the __cause__."""
+
+    def __init__(self, stage: str, error: BaseException):
+        super().__init__(f'Pipeline stage {stage} failed: {error!r}')
+        self.stage = stage
+
+
+class _Cancelled(Exception):
+    """Raised inside stage workers when the pipeline is shutting down."""
+
+
+def _apply(func: Callable, flat: bool, skip_errors: bool,
+           batch: Sequence) -> Tuple[list, float]:
+    """Call func on every item of batch, returning outputs and seconds."""
+    start = perf_counter()
+    outputs = []
+    for item in batch:
+        try:
+            result = func(item)
+        except Exception as error:
+            if not skip_errors:
+                raise
+            logger.warning(f'Pipeline item failed: {item}\n{error}')
+            continue
+        if result is None:
+            continue
+        if flat:
+            outputs.extend(result)
+        else:
+            outputs.append(result)
+    return outputs, perf_counter() - start
+
+
+def _process_worker(func: Callable, flat: bool, skip_errors: bool, tasks,
+                    results):
+    """Apply func to batches from tasks until STOP, in a worker process.
+
+    func is received once when the process starts; only batches and their
+    (outputs, items, seconds) results cross the queues.
+    """
+    while True:
+        batch = tasks.get()
+        if batch is STOP:
+            results.put(STOP)
+            return
+        try:
+            outputs, seconds = _apply(func, flat, skip_errors, batch)
+        except Exception as error:
+            results.put(_Failure(error))
+            results.put(STOP)
+            return
+        results.put((outputs, len(batch), seconds))
+
+
+class Stage:
+    """One stage of a Pipeline.
+
+    func is called once per item and returns the output item, or an
+    iterable of output items if flat is set; None results are dropped.
+    kind selects how it runs:
+
+    thread: workers threads.
+    process: workers processes fed whole batches over bounded
+        multiprocessing queues; func must be picklable and is sent to each
+        process once.
+    asyncio: func is a coroutine function, up to workers items of a batch
+        are awaited concurrently on the stage's own event loop.
+    stream: func takes an iterator of items and yields outputs, run in a
+        single thread, for stages that schedule their own work.
+
+    batch_size is the number of items per batch fed to this stage and
+    maxsize the number of batches its input queue holds.
+    """
+
+    def __init__(self,
+                 name: str,
+                 func: Callable,
+                 workers: int = 1,
+                 kind: str = 'thread',
+                 batch_size: int = BATCH_SIZE,
+                 maxsize: int = MAXSIZE,
+                 flat: bool = False,
+                 skip_errors: bool = False):
+        if kind not in KINDS:
+            raise ValueError(f'Unknown stage kind: {kind}, use one of {KINDS}')
+        self.name = name
+        self.func = func
+        self.workers = 1 if kind == 'stream' else max(1, workers)
+        self.kind = kind
+        self.batch_size = batch_size
+        self.maxsize = maxsize
+        self.flat = flat
+        self.skip_errors = skip_errors
+        self.lock = Lock()
+        self.reset()
+
+    def reset(self):
+        """Clear the counters for a new run."""
+        self.items_in = 0
+        self.items_out = 0
+        self.batches = 0
+        self.busy = 0.0
+        self.started = None
+        self.finished = None
+
+    def record(self, items: int, seconds: float):
+        """Count a processed input batch."""
+        with self.lock:
+            self.batches += 1
+            self.items_in += items
+            self.busy += seconds
+
+    def stats(self) -> dict:
+        """Return items, timing and throughput of this stage."""
+        end = self.finished or perf_counter()
+        elapsed = end - self.started if self.started else 0.0
+        return {
+            'stage': self.name,
+            'kind': self.kind,
+            'workers': self.workers,
+            'batches': self.batches,
+            'items_in': self.items_in,
+            'items_out': self.items_out,
+            'busy': self.busy,
+            'elapsed': elapsed,
+            'rate': self.items_in / elapsed if elapsed else 0.0,
+        }
+
+
+class Pipeline:
+    """Run items through a chain of Stages connected by bounded queues.
+
+    Items move between stages in batches, so every hop costs one lock round
+    trip per batch, and every queue is bounded, so a slow stage throttles
+    the ones before it instead of growing memory.
+
+    run(source) iterates source and yields the outputs of the last stage
+    in the calling thread; only the stages run elsewhere.  The first stage
+    error cancels every stage and is raised from run as a PipelineError
+    once all workers have stopped.  run may be called again once the
+    previous run is finished or closed; queues and stats start afresh.
+    """
+
+    def __init__(self, stages: Sequence[Stage]):
+        if not stages:
+            raise ValueError('A pipeline needs at least one stage.')
+        self.stages = list(stages)
+        self.queues: List[Queue] = []
+        self.error: Optional[PipelineError] = None
+        self._cancel = Event()
+        self._lock = Lock()
+        self._remaining: List[int] = []
+        self._stops: List[int] = []
+        self._threads: List[Thread] = []
+        self._reset()
+
+    def _reset(self):
+        """Prepare fresh queues and state, so run can be called again."""
+        self.queues = [Queue(stage.maxsize) for stage in self.stages]
+        self.queues.append(Queue(self.stages[-1].maxsize))
+        self.error = None
+        self._cancel.clear()
+        self._remaining = [
+            stage.workers if stage.kind == 'thread' else 1
+            for stage in self.stages
+        ]
+        self._stops = [0] * len(self.stages)
+        for stage in self.stages:
+            stage.reset()
+
+    def queue_depths(self) -> Dict[str, int]:
+        """Return the batches waiting in front of each stage."""
+        depths = {
+            stage.name: q.qsize()
+            for stage, q in zip(self.stages, self.queues)
+        }
+        depths['output'] = self.queues[-1].qsize()
+        return depths
+
+    def stats(self) -> List[dict]:
+        """Return the stats of every stage."""
+        return [stage.stats() for stage in self.stages]
+
+    def report(self) -> str:
+        """Return a per-stage throughput table."""
+        lines = [
+            f'{"stage":>10}  {"kind":>7}  {"workers":>7}  {"items":>9}  '
+            f'{"busy s":>8}  {"items/s":>10}'
+        ]
+        for stats in self.stats():
+            lines.append(f'{stats["stage"]:>10}  {stats["kind"]:>7}  '
+                         f'{stats["workers"]:>7}  {stats["items_in"]:>9}  '
+                         f'{stats["busy"]:8.3f}  {stats["rate"]:10,.0f}')
+        return '\n'.join(lines)
+
+    def _fail(self, stage: Stage, error: BaseException):
+        with self._lock:
+            first = self.error is None
+            if first:
+                self.error = PipelineError(stage.name, error)
+                self.error.__cause__ = error
+        # Cancel before logging, which may block on I/O.
+        self._cancel.set()
+        if first:
+            logger.error(f'Pipeline stage {stage.name} failed: {error}')
+
+    def _get(self, q):
+        while True:
+            try:
+                item = q.get(timeout=POLL)
+            except Empty:
+                if self._cancel.is_set():
+                    raise _Cancelled
+                continue
+            if self._cancel.is_set():
+                raise _Cancelled
+            return item
+
+    def _put(self, q, item):
+        while True:
+            if self._cancel.is_set():
+                raise _Cancelled
+            try:
+                q.put(item, timeout=POLL)
+                return
+            except Full:
+                if self._cancel.is_set():
+                    raise _Cancelled
+
+    def _emit(self, index: int, outputs: list):
+        """Put the outputs of stage index downstream in batches."""
+        if not outputs:
+            return
+        stage = self.stages[index]
+        with stage.lock:
+            stage.items_out += len(outputs)
+        if index + 1 < len(self.stages):
+            size = self.stages[index + 1].batch_size
+        else:
+            size = len(outputs)
+        for batch in chunks(outputs, size):
+            self._put(self.queues[index + 1], tuple(batch))
+
+    def _worker_done(self, index: int):
+        with self._lock:
+            self._remaining[index] -= 1
+            last = not self._remaining[index]
+        if last:
+            self.stages[index].finished = perf_counter()
+            DBG(f'Pipeline stage {self.stages[index].name} finished')
+            try:
+                self._put(self.queues[index + 1], STOP)
+            except _Cancelled:
+                pass
+
+    def _run_worker(self, index: int, target: Callable):
+        stage = self.stages[index]
+        try:
+            target(index, stage, self.queues[index])
+        except _Cancelled:
+            pass
+        except Exception as error:
+            self._fail(stage, error)
+        finally:
+            self._worker_done(index)
+
+    def _thread(self, index: int, stage: Stage, in_q):
+        while True:
+            batch = self._get(in_q)
+            if batch is STOP:
+                with self._lock:
+                    self._stops[index] += 1
+                    last = self._stops[index] >= stage.workers
+                if not last:
+                    # Wake the next sibling worker.
+                    self._put(in_q, STOP)
+                return
+            outputs, seconds = _apply(stage.func, stage.flat,
+                                      stage.skip_errors, batch)
+            stage.record(len(batch), seconds)
+            self._emit(index, outputs)
+
+    def _process(self, index: int, stage: Stage, in_q):
+        context = get_context()
+        tasks = context.Queue(2 * stage.workers)
+        results = context.Queue()
+        workers = [
+            context.Process(target=_process_worker,
+                            args=(stage.func, stage.flat, stage.skip_errors,
+                                  tasks, results),
+                            name=f'{stage.name}-{worker}',
+                            daemon=True) for worker in range(stage.workers)
+        ]
+        for worker in workers:
+            worker.start()
+        feeder = Thread(target=self._feed_processes,
+                        args=(in_q, tasks, stage.workers),
+                        name=f'{stage.name}-feed',
+                        daemon=True)
+        feeder.start()
+        try:
+            stopped = 0
+            lost = False
+            while stopped < stage.workers:
+                try:
+                    result = results.get(timeout=POLL)
+                except Empty:
+                    if self._cancel.is_set():
+                        raise _Cancelled
+                    exited = [
+                        worker for worker in workers
+                        if worker.exitcode is not None
+                    ]
+                    # A worker's STOP is flushed to the pipe before it
+                    # exits, so a clean exit shows up by the next poll.
+                    if any(worker.exitcode for worker in exited) or (
+                            lost and len(exited) > stopped):
+                        raise RuntimeError('Pipeline worker process died.')
+                    lost = len(exited) > stopped
+                    continue
+                lost = False
+                if result is STOP:
+                    stopped += 1
+                elif isinstance(result, _Failure):
+                    raise result.error
+                else:
+                    outputs, items, seconds = result
+                    stage.record(items, seconds)
+                    self._emit(index, outputs)
+        except BaseException:
+            # Release the feeder before waiting for it.
+            self._cancel.set()
+            raise
+        finally:
+            feeder.join()
+            for worker in workers:
+                worker.join(POLL * 10)
+                if worker.is_alive():
+                    worker.terminate()
+            tasks.cancel_join_thread()
+            results.cancel_join_thread()
+
+    def _feed_processes(self, in_q, tasks, workers: int):
+        """Move batches from in_q to the worker processes."""
+        try:
+            while True:
+                batch = self._get(in_q)
+                self._put(tasks, batch)
+                if batch is STOP:
+                    for _ in range(workers - 1):
+                        self._put(tasks, STOP)
+                    return
+        except _Cancelled:
+            for _ in range(workers):
+                try:
+                    tasks.put_nowait(STOP)
+                except Full:
+                    break
+
+    def _asyncio(self, index: int, stage: Stage, in_q):
+        loop = asyncio.new_event_loop()
+
+        async def apply(batch):
+            start = perf_counter()
+            semaphore = asyncio.Semaphore(stage.workers)
+
+            async def call(item):
+                async with semaphore:
+                    return await stage.func(item)
+
+            results = await asyncio.gather(*map(call, batch),
+                                           return_exceptions=True)
+            outputs = []
+            for item, result in zip(batch, results):
+                if isinstance(result, Exception):
+                    if not stage.skip_errors:
+                        raise result
+                    logger.warning(f'Pipeline item failed: {item}\n{result}')
+                elif result is not None:
+                    if stage.flat:
+                        outputs.extend(result)
+                    else:
+                        outputs.append(result)
+            return outputs, perf_counter() - start
+
+        try:
+            while True:
+                batch = self._get(in_q)
+                if batch is STOP:
+                    return
+                outputs, seconds = loop.run_until_complete(apply(batch))
+                stage.record(len(batch), seconds)
+                self._emit(index, outputs)
+        finally:
+            loop.close()
+
+    def _stream(self, index: int, stage: Stage, in_q):
+        buffer = []
+        waited = [0.0]
+        if index + 1 < len(self.stages):
+            size = self.stages[index + 1].batch_size
+        else:
+            size = stage.batch_size
+
+        def flush():
+            self._emit(index, buffer[:])
+            buffer.clear()
+
+        def items():
+            while True:
+                if buffer and in_q.empty():
+                    flush()
+                start = perf_counter()
+                batch = self._get(in_q)
+                waited[0] += perf_counter() - start
+                if batch is STOP:
+                    return
+                stage.record(len(batch), 0.0)
+                yield from batch
+
+        start = perf_counter()
+        for output in stage.func(items()):
+            if self._cancel.is_set():
+                raise _Cancelled
+            buffer.append(output)
+            if len(buffer) >= size:
+                flush()
+        flush()
+        with stage.lock:
+            stage.busy = perf_counter() - start - waited[0]
+
+    def _start(self):
+        self._reset()
+        for index, stage in enumerate(self.stages):
+            stage.started = perf_counter()
+            target = getattr(self, f'_{stage.kind}')
+            for worker in range(self._remaining[index]):
+                thread = Thread(target=self._run_worker,
+                                args=(index, target),
+                                name=f'{stage.name}-{worker}',
+                                daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _check(self):
+        if self.error is not None:
+            raise self.error
+
+    def _ready(self, out_q) -> Iterator:
+        """Yield outputs already waiting, without blocking."""
+        while True:
+            try:
+                batch = out_q.get_nowait()
+            except Empty:
+                return
+            self._check()
+            if batch is STOP:
+                # Put it back for the final drain.
+                out_q.put(STOP)
+                return
+            yield from batch
+
+    def run(self, source: Iterable) -> Iterator:
+        """Feed source through the stages, yielding final outputs."""
+        self._start()
+        first, out_q = self.queues[0], self.queues[-1]
+        finished = False
+        try:
+            batches = chunks(source, self.stages[0].batch_size)
+            for batch in chain(map(tuple, batches), [STOP]):
+                self._check()
+                while True:
+                    try:
+                        first.put(batch, timeout=POLL)
+                        break
+                    except Full:
+                        self._check()
+                        yield from self._ready(out_q)
+                yield from self._ready(out_q)
+            while True:
+                try:
+                    batch = out_q.get(timeout=POLL)
+                except Empty:
+                    self._check()
+                    continue
+                self._check()
+                if batch is STOP:
+                    break
+                yield from batch
+            finished = True
+        finally:
+            if not finished:
+                self._cancel.set()
+            for thread in self._threads:
+                thread.join()
+            self._threads = []
+        self._check()
@@ -0,0 +1,90 @@
+"""Bulk path tracking in SQLite.
+
+PathTracker remembers which paths have been seen.  Paths are added in
+batches with ``INSERT OR IGNORE`` and executemany inside one transaction,
+and the new ones are read back by rowid, so no per-path statement,
+transaction or IntegrityError is involved.
+"""
+import sqlite3
+from typing import Iterable, Iterator, List
+
+from bripy.bllb.iter import chunks
+from bripy.bllb.logging import DBG
+
+__all__ = ['PathTracker']
+
+BATCH_SIZE = 10000
+
+
+class PathTracker:
+    """Set of seen paths persisted in a SQLite table.
+
+    The table is ``table (path TEXT PRIMARY KEY)``, compatible with the
+    tracking databases created by the scripts.
+    """
+
+    def __init__(self, database='tracking.db', table: str = 'files'):
+        self.database = str(database)
+        self.table = table
+        self.connection = sqlite3.connect(self.database,
+                                          isolation_level=None)
+        self.connection.execute(
+            f'CREATE TABLE IF NOT EXISTS "{table}" (path TEXT PRIMARY KEY)')
+        self.seen = 0
+        self.added = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self) -> int:
+        return self.connection.execute(
+            f'SELECT count(*) FROM "{self.table}"').fetchone()[0]
+
+    def __contains__(self, path) -> bool:
+        return self.connection.execute(
+            f'SELECT 1 FROM "{self.table}" WHERE path = ?',
+            (str(path), )).fetchone() is not None
+
+    def add(self, paths: Iterable) -> List[str]:
+        """Record a batch of paths, returning the new ones in order.
+
+        New rows get rowids above the largest one before the insert, which
+        is how they are told apart from ignored duplicates.  The write lock
+        is taken up front, so no other writer can insert in between.
+        """
+        paths = [(str(path), ) for path in paths]
+        self.connection.execute('BEGIN IMMEDIATE')
+        try:
+            last, = self.connection.execute(
+                f'SELECT coalesce(max(rowid), 0) FROM "{self.table}"'
+            ).fetchone()
+            self.connection.executemany(
+                f'INSERT OR IGNORE INTO "{self.table}" (path) VALUES (?)',
+                paths)
+            new = [
+                row[0] for row in self.connection.execute(
+                    f'SELECT path FROM "{self.table}" WHERE rowid > ? '
+                    'ORDER BY rowid', (last, ))
+            ]
+        except Exception:
+            self.connection.execute('ROLLBACK')
+            raise
+        self.connection.execute('COMMIT')
+        self.seen += len(paths)
+        self.added += len(new)
+        DBG(f'Tracked {len(paths)} paths, {len(new)} new')
+        return new
+
+    def track(self, paths: Iterable,
+              batch_size: int = BATCH_SIZE) -> Iterator[str]:
+        """Yield the paths not seen before, recording them batch by batch."""
+        for batch in chunks(paths, batch_size):
+            yield from self.add(batch)
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
@@ -0,0 +1,256 @@
+"""Persistent file catalog for incremental examinator scans.
+
+The catalog keeps one row per path with the stat key
+(size, mtime_ns, inode, dev) that was current when the file was last hashed.
+A re-scan only re-hashes entries whose stat key changed, and paths that are
+no longer found are kept as tombstones rather than removed.
+"""
+from datetime import datetime
+from functools import partial
+import os
+import sqlite3
+from stat import S_ISDIR, S_ISREG
+from typing import Callable, Dict, Iterator, NamedTuple, Optional
+
+from bripy.bllb.file import DEFAULT_ALGORITHM, hash_blocks
+from bripy.bllb.filter import FilterSpec
+from bripy.bllb.fs import walk_entries
+from bripy.bllb.logging import logger, DBG
+
+__all__ = ['Catalog', 'StatKey', 'stat_key', 'incremental_scan']
+
+COMMIT_EVERY = 10000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scans (
+    scan_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    basepath TEXT,
+    started TEXT,
+    finished TEXT
+);
+CREATE TABLE IF NOT EXISTS catalog (
+    path TEXT PRIMARY KEY,
+    st_size INTEGER,
+    st_mtime_ns INTEGER,
+    st_ino INTEGER,
+    st_dev INTEGER,
+    is_dir INTEGER NOT NULL DEFAULT 0,
+    is_file INTEGER NOT NULL DEFAULT 0,
+    digest TEXT,
+    hash_algorithm TEXT,
+    first_scan INTEGER,
+    last_scan INTEGER,
+    deleted INTEGER NOT NULL DEFAULT 0,
+    deleted_scan INTEGER
+);
+CREATE INDEX IF NOT EXISTS catalog_last_scan ON catalog (last_scan);
+"""
+
+
+class StatKey(NamedTuple):
+    """Stat fields used to decide whether a file changed."""
+
+    st_size: int
+    st_mtime_ns: int
+    st_ino: int
+    st_dev: int
+
+
+def stat_key(stat: os.stat_result) -> StatKey:
+    """Build the change detection key from a stat result."""
+    return StatKey(stat.st_size, stat.st_mtime_ns, stat.st_ino, stat.st_dev)
+
+
+class Catalog:
+    """SQLite backed catalog of paths, stat keys and digests."""
+
+    def __init__(self, database='catalog.db'):
+        self.database = str(database)
+        self.connection = sqlite3.connect(self.database)
+        self.connection.executescript(SCHEMA)
+        self.scan_id = None
+        self._pending = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Commit outstanding changes and close the connection."""
+        if self.connection is not None:
+            self.connection.commit()
+            self.connection.close()
+            self.connection = None
+
+    def begin_scan(self, basepath='') -> int:
+        """Register a new scan and return its id."""
+        cursor = self.connection.execute(
+            'INSERT INTO scans (basepath, started) VALUES (?, ?)',
+            (str(basepath), datetime.now().isoformat()))
+        self.connection.commit()
+        self.scan_id = cursor.lastrowid
+        DBG(f'Started catalog scan {self.scan_id}: {basepath}')
+        return self.scan_id
+
+    def finish_scan(self,
+                    basepath=None,
+                    spec: Optional[FilterSpec] = None) -> int:
+        """Tombstone paths below basepath not seen in the current scan.
+
+        Paths of other roots in the same catalog are left alone, and so
+        are paths rejected by spec, which the scan did not look at.  With
+        size or mtime bounds, the current values decide, so unseen paths
+        that still exist are kept.  Returns the number of newly deleted
+        paths.
+        """
+        where = 'WHERE deleted = 0 AND last_scan < ?'
+        params = [self.scan_id]
+        prefix = ''
+        if basepath is not None:
+            prefix = os.path.join(str(basepath), '')
+            where += ' AND substr(path, 1, ?) = ?'
+            params.extend([len(prefix), prefix])
+        if spec is None:
+            deleted = self.connection.execute(
+                'UPDATE catalog SET deleted = 1, deleted_scan = ? ' + where,
+                [self.scan_id, *params]).rowcount
+        else:
+            paths = [(self.scan_id, path) for path, is_dir
+                     in self.connection.execute(
+                         'SELECT path, is_dir FROM catalog ' + where, params)
+                     if spec.keep_path(
+                         path[len(prefix):].replace(os.sep, '/'),
+                         bool(is_dir))
+                     and not (spec.bounded and os.path.lexists(path))]
+            self.connection.executemany(
+                'UPDATE catalog SET deleted = 1, deleted_scan = ? '
+                'WHERE path = ?', paths)
+            deleted = len(paths)
+        self.connection.execute(
+            'UPDATE scans SET finished = ? WHERE scan_id = ?',
+            (datetime.now().isoformat(), self.scan_id))
+        self.connection.commit()
+        self._pending = 0
+        return deleted
+
+    def get(self, path) -> Optional[tuple]:
+        """Return (StatKey, digest, hash_algorithm, deleted) for a path.
+
+        Returns None if the path is unknown.
+        """
+        row = self.connection.execute(
+            'SELECT st_size, st_mtime_ns, st_ino, st_dev, digest, '
+            'hash_algorithm, deleted FROM catalog WHERE path = ?',
+            (str(path), )).fetchone()
+        if row is None:
+            return None
+        return StatKey(*row[:4]), row[4], row[5], bool(row[6])
+
+    def touch(self, path):
+        """Mark an unchanged path as seen in the current scan."""
+        self.connection.execute(
+            'UPDATE catalog SET last_scan = ? WHERE path = ?',
+            (self.scan_id, str(path)))
+        self._maybe_commit()
+
+    def update(self,
+               path,
+               key: StatKey,
+               digest=None,
+               is_dir=False,
+               is_file=False,
+               hash_algorithm=None):
+        """Insert or replace the catalog row for a new or changed path."""
+        if digest is None:
+            hash_algorithm = None
+        self.connection.execute(
+            'INSERT INTO catalog (path, st_size, st_mtime_ns, st_ino, st_dev, '
+            'is_dir, is_file, digest, hash_algorithm, first_scan, last_scan, '
+            'deleted, deleted_scan) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 0, NULL) '
+            'ON CONFLICT (path) DO UPDATE SET '
+            'st_size = excluded.st_size, st_mtime_ns = excluded.st_mtime_ns, '
+            'st_ino = excluded.st_ino, st_dev = excluded.st_dev, '
+            'is_dir = excluded.is_dir, is_file = excluded.is_file, '
+            'digest = excluded.digest, '
+            'hash_algorithm = excluded.hash_algorithm, '
+            'last_scan = excluded.last_scan, deleted = 0, deleted_scan = NULL',
+            (str(path), *key, int(is_dir), int(is_file), digest,
+             hash_algorithm, self.scan_id, self.scan_id))
+        self._maybe_commit()
+
+    def files(self, hash_algorithm: Optional[str] = None) -> Iterator[tuple]:
+        """Yield (path, st_size, digest) for live regular files.
+
+        Digests made with an algorithm other than hash_algorithm are
+        returned as None.
+        """
+        self.connection.commit()
+        for path, size, digest, algorithm in self.connection.execute(
+                'SELECT path, st_size, digest, hash_algorithm FROM catalog '
+                'WHERE is_file = 1 AND deleted = 0'):
+            if hash_algorithm is not None and algorithm != hash_algorithm:
+                digest = None
+            yield path, size, digest
+
+    def tombstones(self) -> list:
+        """Return the paths currently marked as deleted."""
+        return [
+            row[0] for row in self.connection.execute(
+                'SELECT path FROM catalog WHERE deleted = 1 ORDER BY path')
+        ]
+
+    def _maybe_commit(self):
+        self._pending += 1
+        if self._pending >= COMMIT_EVERY:
+            self.connection.commit()
+            self._pending = 0
+
+
+def incremental_scan(basepath,
+                     catalog: Catalog,
+                     opt_md5: bool = True,
+                     algorithm: str = DEFAULT_ALGORITHM,
+                     hasher: Optional[Callable] = None,
+                     spec: Optional[FilterSpec] = None) -> Dict[str, int]:
+    """Update catalog from basepath, hashing only new or changed files.
+
+    Unchanged paths cost a single lstat and an indexed catalog lookup.
+    Files hashed with a different algorithm are hashed again.  Paths
+    rejected by spec are neither scanned nor tombstoned.
+    Returns counts of new, changed, unchanged, deleted and error paths.
+    """
+    if hasher is None:
+        hasher = partial(hash_blocks, algorithm=algorithm)
+    counts = dict(new=0, changed=0, unchanged=0, deleted=0, errors=0)
+    catalog.begin_scan(basepath)
+    for entry in walk_entries(basepath, spec):
+        path = entry.path
+        try:
+            st = entry.stat(follow_symlinks=False)
+        except OSError as error:
+            logger.warning(f'Could not stat item: {path}\n{error}')
+            counts['errors'] += 1
+            continue
+        key = stat_key(st)
+        is_file = S_ISREG(st.st_mode)
+        previous = catalog.get(path)
+        if previous is not None:
+            old_key, old_digest, old_algorithm, deleted = previous
+            hashed = old_digest is not None and old_algorithm == algorithm
+            if (not deleted and old_key == key
+                    and (hashed or not opt_md5 or not is_file)):
+                catalog.touch(path)
+                counts['unchanged'] += 1
+                continue
+            counts['changed'] += 1
+        else:
+            counts['new'] += 1
+        digest = hasher(path) if opt_md5 and is_file else None
+        catalog.update(path, key, digest, S_ISDIR(st.st_mode), is_file,
+                       algorithm)
+    counts['deleted'] = catalog.finish_scan(basepath, spec)
+    logger.info(f'Incremental scan of {basepath}: {counts}')
+    return counts
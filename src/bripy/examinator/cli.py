@@ -0,0 +1,133 @@
+"""Command line interface for examinator."""
+from typing import Optional, Tuple
+
+import click
+
+from bripy.bllb.file import available_algorithms, set_hash_cache
+from bripy.bllb.filter import DEFAULT_EXCLUDES, FilterSpec
+from bripy.examinator import examinator
+from bripy.examinator.progress import Progress
+
+
+@click.command()
+@click.argument("roots", nargs=-1, required=True,
+                type=click.Path(exists=True, file_okay=False))
+@click.option("--stat-workers", default=examinator.STAT_WORKERS,
+              show_default=True, help="Stat threads.")
+@click.option("--workers", default=examinator.DEVICE_WORKERS,
+              show_default=True, help="Hash threads per device.")
+@click.option("--large-workers", default=examinator.LARGE_WORKERS,
+              show_default=True, help="Large file hash threads per device.")
+@click.option("--large-file", default=examinator.LARGE_FILE,
+              show_default=True, help="Size in bytes of a large file.")
+@click.option("--backend", type=click.Choice(['thread', 'process']),
+              default=examinator.HASH_BACKEND, show_default=True,
+              help="Hash on device thread lanes or a process pool.")
+@click.option("--processes", type=int, default=examinator.PROCESS_WORKERS,
+              help="Process pool size for the process backend.")
+@click.option("--algorithm", type=click.Choice(available_algorithms()),
+              default=examinator.HASH_ALGORITHM, show_default=True,
+              help="Content hash algorithm.")
+@click.option("--hash/--no-hash", "opt_md5", default=examinator.OPT_MD5,
+              show_default=True, help="Hash regular files.")
+@click.option("--output", default=examinator.OUTPUT_DB, show_default=True,
+              help="SQLite output database.")
+@click.option("--parquet", default=examinator.OUTPUT_PARQUET,
+              help="Write Parquet part files to this directory instead "
+              "of SQLite.")
+@click.option("--batch-size", default=examinator.BATCH_SIZE,
+              show_default=True, help="Records per output batch.")
+@click.option("--resume/--no-resume", default=examinator.RESUME,
+              show_default=True, help="Resume an interrupted SQLite run.")
+@click.option("--catalog", default=None,
+              help="Run an incremental scan against this catalog instead.")
+@click.option("--hash-cache", default=examinator.HASH_CACHE,
+              help="Persistent hash cache database to reuse digests from.")
+@click.option("--exclude", multiple=True,
+              help="Gitignore-style pattern to skip, may be repeated.")
+@click.option("--exclude-from", type=click.Path(exists=True, dir_okay=False),
+              help="File of gitignore-style patterns to skip.")
+@click.option("--skip-common/--no-skip-common", default=False,
+              show_default=True,
+              help="Skip VCS, cache and dask worker directories.")
+@click.option("--min-size", type=int, default=None,
+              help="Skip files smaller than this many bytes.")
+@click.option("--max-size", type=int, default=None,
+              help="Skip files larger than this many bytes.")
+@click.option("--ext", multiple=True,
+              help="Only include files with this extension, may be repeated.")
+@click.option("--interval", default=1.0, show_default=True,
+              help="Seconds between progress lines, 0 to disable.")
+@click.option("-v", "--verbose", count=True, help="Increase log level.")
+def main(roots: Tuple[str], stat_workers: int, workers: int,
+         large_workers: int, large_file: int, backend: str,
+         processes: Optional[int], algorithm: str, opt_md5: bool,
+         output: str, parquet: Optional[str], batch_size: int, resume: bool,
+         catalog: Optional[str], hash_cache: Optional[str],
+         exclude: Tuple[str], exclude_from: Optional[str], skip_common: bool,
+         min_size: Optional[int], max_size: Optional[int], ext: Tuple[str],
+         interval: float, verbose: int) -> int:
+    """Inventory and hash the files below ROOTS."""
+    if verbose:
+        examinator.start_log(True, max(4 - verbose, 1) * 10)
+    if hash_cache:
+        set_hash_cache(hash_cache)
+    patterns = [*DEFAULT_EXCLUDES] if skip_common else []
+    if exclude_from:
+        with open(exclude_from) as lines:
+            patterns.extend(lines)
+    patterns.extend(exclude)
+    spec = None
+    if patterns or min_size is not None or max_size is not None or ext:
+        spec = FilterSpec(patterns,
+                          min_size=min_size,
+                          max_size=max_size,
+                          extensions=ext or None)
+    if catalog:
+        progress = Progress(interval=None)
+        counts = examinator.examine_incremental(roots, catalog, opt_md5,
+                                                algorithm, spec)
+        progress.update(counts['new'] + counts['changed'] +
+                        counts['unchanged'])
+        click.echo(counts)
+        click.echo(progress.summary())
+        close_hash_cache()
+        return 0
+    sink = examinator.make_sink(output, parquet, batch_size)
+    scheduler = examinator.make_scheduler(algorithm, backend, workers,
+                                          large_workers, large_file,
+                                          processes)
+
+    def depths():
+        return {
+            **scheduler.queue_depths(),
+            'pending': scheduler.pending,
+            'batch': sink.size,
+        }
+
+    progress = Progress(interval=interval or None,
+                        depths=depths,
+                        hashed=lambda: scheduler.bytes_hashed)
+    total = examinator.examine(roots, opt_md5, sink, scheduler, resume,
+                               progress, spec, stat_workers)
+    if progress.interval:
+        click.echo(err=True)
+    click.echo(f'Records written: {total}')
+    if opt_md5:
+        click.echo(f'Hardlink groups: {scheduler.link_groups} '
+                   f'({scheduler.files_linked} links not rehashed)')
+    click.echo(progress.summary())
+    close_hash_cache()
+    return 0
+
+
+def close_hash_cache():
+    """Report on and close the active hash cache."""
+    cache = set_hash_cache(None)
+    if cache is not None:
+        click.echo(f'Hash cache: {cache.hits} hits, {cache.misses} misses')
+        cache.close()
+
+
+if __name__ == "__main__":
+    main()
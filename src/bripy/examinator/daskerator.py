@@ -2,32 +2,230 @@
 import logging
 import sys
 from functools import partial
-from itertools import chain
-from pathlib import Path
+from operator import getitem
 from pprint import pprint
+from typing import Iterator, List, Optional, Tuple
 
 import click
+import dask.dataframe as dd
 import pandas as pd
-from dask.distributed import Client, LocalCluster, get_client
-from fsspec import get_fs_token_paths
+from dask.distributed import Client, LocalCluster, as_completed, get_client
+from bripy.bllb.fs import get_stat_fs, ls_info
+from bripy.bllb.fs_cache import get_fs
+from bripy.bllb.iter import chunks
+from bripy.bllb.logging import logger, DBG
 
-from bripy.bllb.fs import get_dir_fs, get_stat_fs, is_dir, is_file
+BATCH_SIZE = 64
+SUBTREE_BUDGET = 256
+FRAME_DTYPES = {
+    'name': object,
+    'protocol': object,
+    'type': object,
+    'size': 'Int64',
+    'created': 'datetime64[ns]',
+    'mtime': 'datetime64[ns]',
+    'islink': 'boolean',
+    'mode': 'Int64',
+    'uid': 'Int64',
+    'gid': 'Int64',
+    'ino': 'Int64',
+    'nlink': 'Int64',
+    'words': object,
+    'digest': object,
+    'hash_algorithm': object,
+}
+
+
+def list_dirs(dirs: List[str]) -> Tuple[List[str], List[dict]]:
+    """List a batch of directories on a worker.
+
+    Uses ``fs.ls(detail=True)`` so entries are split into subdirectories
+    and files without any further per-entry requests.  Returns the
+    subdirectory URLs and the info dicts of the files, with ``name`` set to
+    the file URL.
+    """
+    subdirs, files = [], []
+    for d in dirs:
+        try:
+            entries = ls_info(d)
+        except Exception as error:
+            logger.warning(f'Could not list directory: {d}\n{error}')
+            continue
+        for info in entries:
+            if info['type'] == 'directory':
+                subdirs.append(info['name'])
+            else:
+                files.append(info)
+    return subdirs, files
+
+
+def walk(client, path, batch_size=BATCH_SIZE) -> Iterator[dict]:
+    """Walk path on the cluster, yielding file info dicts.
+
+    Directories are listed in batches of batch_size per task, and the
+    subdirectories of each batch are submitted as soon as it completes, so
+    no level waits for the slowest directory of the previous level.
+    """
+    futures = as_completed([client.submit(list_dirs, [path], pure=False)])
+    for future in futures:
+        subdirs, files = future.result()
+        DBG(f'Listed batch: {len(subdirs)} dirs, {len(files)} files')
+        yield from files
+        for batch in chunks(subdirs, batch_size):
+            futures.add(client.submit(list_dirs, batch, pure=False))
+
+
+def walk_subtree(dirs: List[str],
+                 budget: int = SUBTREE_BUDGET) -> Tuple[List[str], List[dict]]:
+    """Walk dirs depth-first on a worker, listing at most budget dirs.
+
+    Returns the frontier of directories not yet listed and the file info
+    dicts found, so the client can hand the rest of the subtree to other
+    workers.
+    """
+    stack = list(dirs)
+    files = []
+    listed = 0
+    while stack and listed < budget:
+        subdirs, batch_files = list_dirs([stack.pop()])
+        listed += 1
+        files.extend(batch_files)
+        stack.extend(subdirs)
+    return stack, files
+
+
+def walk_stealing(client, path, budget=SUBTREE_BUDGET,
+                  slots=None) -> Iterator[dict]:
+    """Walk path on the cluster with budgeted subtree tasks.
+
+    Each task walks its subtrees until it has listed budget directories and
+    returns what is left.  That frontier is split across as many new tasks
+    as there are idle slots (one per worker thread by default) and
+    submitted immediately, so deep or slow subtrees are spread over idle
+    workers instead of stalling one of them.
+    """
+    if slots is None:
+        slots = sum(client.nthreads().values()) or 1
+    futures = as_completed(
+        [client.submit(walk_subtree, [path], budget, pure=False)])
+    for future in futures:
+        frontier, files = future.result()
+        DBG(f'Subtree task: {len(frontier)} dirs left, {len(files)} files')
+        yield from files
+        if frontier:
+            parts = max(1, min(len(frontier), slots - futures.count()))
+            for part in range(parts):
+                futures.add(
+                    client.submit(walk_subtree,
+                                  frontier[part::parts],
+                                  budget,
+                                  pure=False))
+
+
+def stat_info(info: dict, opt_md5: bool = False) -> dict:
+    """Stat a listed file from its info dict, without another request."""
+    return get_stat_fs(info['name'], opt_md5, info=info)
+
+
+def stat_frame(infos: List[dict], opt_md5: bool = False) -> pd.DataFrame:
+    """Stat files on a worker into a fixed-schema DataFrame partition."""
+    records = [stat_info(info, opt_md5) for info in infos]
+    frame = pd.DataFrame.from_records(records, columns=[*FRAME_DTYPES])
+    frame['words'] = frame['words'].map(
+        lambda words: ' '.join(sorted(words))
+        if isinstance(words, set) else words)
+    return frame.astype(FRAME_DTYPES)
+
+
+def walk_subtree_frame(
+        dirs: List[str],
+        budget: int = SUBTREE_BUDGET,
+        opt_md5: bool = False) -> Tuple[List[str], pd.DataFrame]:
+    """Walk a budgeted subtree and stat its files on the worker."""
+    frontier, files = walk_subtree(dirs, budget)
+    return frontier, stat_frame(files, opt_md5)
+
+
+def write_frame(frame: pd.DataFrame, path: str) -> int:
+    """Write a partition to Parquet on the worker, returning its rows.
+
+    path may be any fsspec URL; its directory is created on the worker,
+    where the file is written.
+    """
+    fs, path = get_fs(path)
+    fs.makedirs(fs._parent(path), exist_ok=True)
+    with fs.open(path, 'wb') as f:
+        frame.to_parquet(f, index=False)
+    return len(frame)
+
+
+def inventory(client,
+              path,
+              budget: int = SUBTREE_BUDGET,
+              slots: Optional[int] = None,
+              opt_md5: bool = False,
+              output: Optional[str] = None):
+    """Build a file inventory of path without collecting it on the client.
+
+    Every subtree task stats its own files into a DataFrame partition that
+    stays on the worker; only the directory frontier comes back to the
+    client.  Returns a dask DataFrame over the partitions, or, if output is
+    set, writes one Parquet file per partition into that directory on the
+    workers and returns the total number of rows.
+    """
+    if slots is None:
+        slots = sum(client.nthreads().values()) or 1
+    frames = []
+    frontiers = as_completed()
+
+    def submit(dirs):
+        task = client.submit(walk_subtree_frame,
+                             dirs,
+                             budget,
+                             opt_md5,
+                             pure=False)
+        frame = client.submit(getitem, task, 1)
+        if output is not None:
+            part = f'{output.rstrip("/")}/part-{len(frames):06d}.parquet'
+            frame = client.submit(write_frame, frame, part, pure=False)
+        frames.append(frame)
+        frontiers.add(client.submit(getitem, task, 0))
+
+    submit([path])
+    for future in frontiers:
+        frontier = future.result()
+        if frontier:
+            parts = max(1, min(len(frontier), slots - frontiers.count()))
+            for part in range(parts):
+                submit(frontier[part::parts])
+    if output is not None:
+        return sum(client.gather(frames))
+    return dd.from_delayed(frames, meta=stat_frame([]), verify_meta=False)
 
 
 @click.command()
 @click.argument("path")
-def main(path):
+@click.option("--batch-size", default=BATCH_SIZE, show_default=True,
+              help="Directories listed per task when --budget is 0.")
+@click.option("--budget", default=SUBTREE_BUDGET, show_default=True,
+              help="Directories walked per subtree task, 0 to walk in "
+              "fixed batches.")
+@click.option("--output", default=None,
+              help="Directory for Parquet partitions written by workers.")
+def main(path, batch_size, budget, output):
     client = get_client()
-    dirs = [path]
-    files = []
-    while len(dirs):
-        futures = client.map(get_dir_fs, dirs)
-        results = client.gather(futures)
-        pprint([*zip(dirs, results)])
-        dirs = [*filter(is_dir, chain(*results))]
-        files.extend([*chain(*results)])
-    process = partial(get_stat_fs, opt_md5=True)
-    futures = client.map(process, files)
+    if budget:
+        result = inventory(client, path, budget, opt_md5=True, output=output)
+        if output is None:
+            print(result)
+            print(f'Rows: {len(result)}')
+        else:
+            print(f'Rows written to {output}: {result}')
+        return
+    infos = list(walk(client, path, batch_size))
+    files = [info['name'] for info in infos]
+    process = partial(stat_info, opt_md5=True)
+    futures = client.map(process, infos)
     results = client.gather(futures)
     df = pd.DataFrame(results)
     print("\n\n\n")
@@ -35,8 +233,8 @@ def main(path):
     print(df)
 
 if __name__ == "__main__":
-    logger = logging.getLogger()
-    logger.setLevel("DEBUG")
+    root_logger = logging.getLogger()
+    root_logger.setLevel("DEBUG")
     cluster = LocalCluster()
     client = Client(cluster)
     sys.exit(main())  # pragma: no cover
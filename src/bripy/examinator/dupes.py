@@ -0,0 +1,118 @@
+"""Duplicate file detection for examinator inventories.
+
+Files are grouped by size first, so files with a unique size are never read.
+Within each size group only the first and last ``chunk_size`` bytes are
+hashed, and the full digest is computed only for files whose partial
+hashes still collide.
+"""
+from collections import defaultdict
+from functools import partial
+import os
+from typing import Callable, Dict, Iterable, List, Optional
+
+from bripy.bllb.file import DEFAULT_ALGORITHM, get_hasher, hash_blocks
+from bripy.bllb.logging import logger, DBG
+
+__all__ = ['partial_hash', 'find_duplicates', 'catalog_duplicates']
+
+CHUNK_SIZE = 64 * 1024
+
+
+def partial_hash(path,
+                 size: int,
+                 chunk_size: int = CHUNK_SIZE,
+                 algorithm: str = DEFAULT_ALGORITHM) -> str:
+    """Hash the first and last chunk_size bytes of a file.
+
+    Files no larger than two chunks are read completely, so their partial
+    hash is also a full content hash.
+    """
+    hasher = get_hasher(algorithm)
+    with open(path, 'rb') as file:
+        if size <= 2 * chunk_size:
+            hasher.update(file.read())
+        else:
+            hasher.update(file.read(chunk_size))
+            file.seek(-chunk_size, os.SEEK_END)
+            hasher.update(file.read(chunk_size))
+    return hasher.hexdigest()
+
+
+def _group(items: Iterable[tuple], key: Callable) -> List[List[tuple]]:
+    groups = defaultdict(list)
+    for item in items:
+        groups[key(item)].append(item)
+    return [group for group in groups.values() if len(group) > 1]
+
+
+def find_duplicates(files: Iterable[tuple],
+                    chunk_size: int = CHUNK_SIZE,
+                    algorithm: str = DEFAULT_ALGORITHM,
+                    hasher: Optional[Callable] = None,
+                    stats: Optional[dict] = None) -> Dict[str, List[str]]:
+    """Find duplicate files.
+
+    files: iterable of (path, size) or (path, size, digest) tuples.  A known
+        digest, e.g. from the catalog, is used instead of a full hash.
+    stats: optional dict updated with bytes_read, partial_hashed and
+        full_hashed counters.
+
+    Returns a dict of digest to the list of paths sharing that content.
+    Zero-length files are keyed by the digest of empty content.
+    """
+    if hasher is None:
+        hasher = partial(hash_blocks, algorithm=algorithm)
+    stats = {} if stats is None else stats
+    stats.update(bytes_read=0, partial_hashed=0, full_hashed=0)
+    entries = [(str(item[0]), item[1], *item[2:3]) for item in files]
+    duplicates = defaultdict(list)
+    for size_group in _group(entries, lambda item: item[1]):
+        size = size_group[0][1]
+        if not size:
+            empty = get_hasher(algorithm).hexdigest()
+            duplicates[empty].extend(entry[0] for entry in size_group)
+            continue
+        if all(len(entry) > 2 and entry[2] for entry in size_group):
+            for known_group in _group(size_group, lambda item: item[2]):
+                duplicates[known_group[0][2]].extend(
+                    _[0] for _ in known_group)
+            continue
+        partials = []
+        for entry in size_group:
+            try:
+                digest = partial_hash(entry[0], size, chunk_size, algorithm)
+            except OSError as error:
+                logger.warning(f'Could not hash item: {entry[0]}\n{error}')
+                continue
+            stats['partial_hashed'] += 1
+            stats['bytes_read'] += min(size, 2 * chunk_size)
+            partials.append((*entry[:2], digest, *entry[2:]))
+        for partial_group in _group(partials, lambda item: item[2]):
+            if size <= 2 * chunk_size:
+                duplicates[partial_group[0][2]].extend(
+                    _[0] for _ in partial_group)
+                continue
+            fulls = []
+            for entry in partial_group:
+                digest = entry[3] if len(entry) > 3 else None
+                if digest is None:
+                    digest = hasher(entry[0])
+                    stats['full_hashed'] += 1
+                    stats['bytes_read'] += size
+                if digest is not None:
+                    fulls.append((entry[0], digest))
+            for full_group in _group(fulls, lambda item: item[1]):
+                duplicates[full_group[0][1]].extend(_[0] for _ in full_group)
+    DBG(f'Duplicate search stats: {stats}')
+    return dict(duplicates)
+
+
+def catalog_duplicates(catalog,
+                       chunk_size: int = CHUNK_SIZE,
+                       algorithm: str = DEFAULT_ALGORITHM,
+                       stats: Optional[dict] = None) -> Dict[str, List[str]]:
+    """Find duplicates among the live files of an examinator catalog."""
+    return find_duplicates(catalog.files(algorithm),
+                           chunk_size,
+                           algorithm,
+                           stats=stats)
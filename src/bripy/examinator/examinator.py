@@ -1,31 +1,41 @@
 """Examinator basic functions."""
-from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
-import datetime as dt
-from hashlib import md5
-import inspect
-from operator import methodcaller
-import os
 from pathlib import Path
 from pprint import pprint as pp
 import sys
-import time
+from typing import Iterable, Optional
 
-import pandas as pd
-from sqlalchemy import create_engine
-
-from bripy.bllb.logging import setup_logging
-from bripy.bllb.file import md5_blocks
-from bripy.bllb.fs import get_stat, get_dir, rglob
+from bripy.bllb.file import set_hash_cache
+from bripy.bllb.filter import FilterSpec
+from bripy.bllb.logging import logger, setup_logging
+from bripy.bllb.q import Pipeline, Stage
+from bripy.bllb.fs import get_entry_stat, walk_entries
+from bripy.examinator.catalog import Catalog, incremental_scan
+from bripy.examinator.journal import Journal
+from bripy.examinator.progress import Progress
+from bripy.examinator.scheduler import HashScheduler, ProcessHashScheduler
+from bripy.examinator.sink import ParquetSink, SqliteSink
 
 
 LOG_ON = False
 LOG_LEVEL = "DEBUG"
 verbose = 2
 OPT_MD5 = True
-WORKERS = None
-EXECUTOR = ThreadPoolExecutor
+HASH_ALGORITHM = 'md5'
+DEVICE_WORKERS = 4
+LARGE_WORKERS = 1
+LARGE_FILE = 1024 * 1024 * 1024
+HASH_BACKEND = 'thread'
+PROCESS_WORKERS = None
+INCREMENTAL = False
+RESUME = False
+BATCH_SIZE = 10000
+OUTPUT_DB = 'output.db'
+OUTPUT_PARQUET = None
+CATALOG = 'catalog.db'
+HASH_CACHE = None
+STAT_WORKERS = 4
+STAT_BATCH = 256
 basepath = Path('..')
-output = r'.\output.csv.gz'
 
 
 def start_log(enable=True, lvl='WARNING'):
@@ -34,35 +44,126 @@ def start_log(enable=True, lvl='WARNING'):
     return log
 
 
+def make_sink(output=OUTPUT_DB, parquet=OUTPUT_PARQUET,
+              batch_size=BATCH_SIZE):
+    """Return a Parquet sink if parquet is set, else a SQLite sink."""
+    if parquet:
+        return ParquetSink(parquet, batch_size=batch_size)
+    return SqliteSink(output, batch_size=batch_size)
+
+
+def make_scheduler(algorithm=HASH_ALGORITHM,
+                   backend=HASH_BACKEND,
+                   device_workers=DEVICE_WORKERS,
+                   large_workers=LARGE_WORKERS,
+                   large_file=LARGE_FILE,
+                   process_workers=PROCESS_WORKERS):
+    """Return the hash scheduler for backend, 'thread' or 'process'."""
+    if backend == 'process':
+        return ProcessHashScheduler(algorithm=algorithm,
+                                    workers=process_workers)
+    return HashScheduler(algorithm=algorithm,
+                         device_workers=device_workers,
+                         large_workers=large_workers,
+                         large_file=large_file)
+
+
+def examine(roots: Iterable,
+            opt_md5: bool = OPT_MD5,
+            sink=None,
+            scheduler=None,
+            resume: bool = RESUME,
+            progress: Optional[Progress] = None,
+            spec: Optional[FilterSpec] = None,
+            stat_workers: int = STAT_WORKERS) -> int:
+    """Walk, stat, hash and persist everything below roots.
+
+    The walk and persist run in the calling thread, which owns the output
+    database; stat and hash run as Pipeline stages in between.  Entries
+    rejected by spec are pruned during the walk.  Returns the number of
+    records written.
+    """
+    roots = [str(root) for root in roots]
+    sink = make_sink() if sink is None else sink
+    scheduler = make_scheduler() if scheduler is None else scheduler
+    progress = Progress(interval=None) if progress is None else progress
+    with sink, scheduler:
+        if isinstance(sink, SqliteSink):
+            entries = Journal(sink, resume=resume).walk(*roots, spec=spec)
+        else:
+            entries = (entry for root in roots
+                       for entry in walk_entries(root, spec))
+        stages = [
+            Stage('stat', get_entry_stat, workers=stat_workers,
+                  batch_size=STAT_BATCH)
+        ]
+        if opt_md5:
+            stages.append(Stage('hash', scheduler.run, kind='stream'))
+        pipeline = Pipeline(stages)
+        progress.pipeline = pipeline
+        records = progress.timed(
+            'pipeline', pipeline.run(progress.timed('walk', entries)))
+        for record in records:
+            previous = progress.switch('persist')
+            sink.add(record)
+            progress.switch(previous)
+            progress.update()
+        progress.switch('persist')
+    progress.switch('other')
+    logger.info(f'Records written: {sink.total} in {sink.batches} batches')
+    if opt_md5:
+        logger.info(f'Hardlink groups: {scheduler.link_groups}, '
+                    f'{scheduler.files_linked} links not rehashed')
+    return sink.total
+
+
+def examine_incremental(roots: Iterable,
+                        catalog=CATALOG,
+                        opt_md5: bool = OPT_MD5,
+                        algorithm: str = HASH_ALGORITHM,
+                        spec: Optional[FilterSpec] = None) -> dict:
+    """Update the catalog from roots, hashing only new or changed files."""
+    totals = {}
+    with Catalog(catalog) as catalog:
+        for root in roots:
+            counts = incremental_scan(root,
+                                      catalog,
+                                      opt_md5=opt_md5,
+                                      algorithm=algorithm,
+                                      spec=spec)
+            for key, value in counts.items():
+                totals[key] = totals.get(key, 0) + value
+    return totals
+
+
 def main():
-    with EXECUTOR(max_workers=WORKERS) as executor:
-        futures = executor.map(get_stat, rglob(basepath))
-    results = [result for result in futures]
-    df = pd.DataFrame(results)
-    pp(df)
-    print(df.info())
-    engine = create_engine('sqlite:///output.db')
-    df.to_sql('files', engine)
-
-    elapsed = time.perf_counter() - s
-    log.info(f"{__file__} executed in {elapsed:0.2f} seconds.".format())
-    log.debug('\n\nFIN\n\n')
-
-
-s = time.perf_counter()
-log_on = LOG_ON
-log_level = LOG_LEVEL
-if verbose:
-    log_on = True
-    log_level = max(4 - verbose, 1) * 10
-global log
-log = start_log(log_on, log_level)
-log.info(f'verbose: {verbose}')
-log.warning(f"\nlogs enabled: {log_on}\nlog_level: {log_level}")
-log.debug(f'Optional md5 hash: {OPT_MD5}')
-time.sleep(0.05)  # Sleep to let logging initialize
+    """Run examinator on basepath with the module settings."""
+    if HASH_CACHE:
+        set_hash_cache(HASH_CACHE)
+    if INCREMENTAL:
+        pp(examine_incremental([basepath]))
+        if HASH_CACHE:
+            set_hash_cache(None).close()
+        return 0
+    sink = make_sink(OUTPUT_DB, OUTPUT_PARQUET, BATCH_SIZE)
+    scheduler = make_scheduler(HASH_ALGORITHM, HASH_BACKEND, DEVICE_WORKERS,
+                               LARGE_WORKERS, LARGE_FILE, PROCESS_WORKERS)
+    progress = Progress(depths=scheduler.queue_depths,
+                        hashed=lambda: scheduler.bytes_hashed)
+    examine([basepath], OPT_MD5, sink, scheduler, RESUME, progress)
+    print(progress.summary())
+    if HASH_CACHE:
+        set_hash_cache(None).close()
+    return 0
+
 
 if __name__ == "__main__":
+    log_on = LOG_ON
+    log_level = LOG_LEVEL
+    if verbose:
+        log_on = True
+        log_level = max(4 - verbose, 1) * 10
+    start_log(log_on, log_level)
     sys.exit(main())  # pragma: no cover
 
 
@@ -0,0 +1,156 @@
+"""Checkpoint journal for resumable examinator runs.
+
+The journal lives in the SqliteSink output database.  Every directory is
+recorded when it is discovered and marked done once all of its entries
+have been written to the output table, in the same transaction as the
+batch that wrote the last of them.  A resumed run only lists directories
+that are not done, and skips entries of those directories that were
+already written, so finished work is never walked, stat'ed or hashed again.
+"""
+import os
+from typing import Iterable, Iterator, List, Optional
+
+from bripy.bllb.filter import FilterSpec
+from bripy.bllb.logging import logger, DBG
+
+__all__ = ['Journal']
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS journal (
+    path TEXT PRIMARY KEY,
+    done INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+
+def _relative(directory: str, roots: List[str]) -> str:
+    """Return the prefix of entries of directory relative to its root."""
+    for root in sorted(roots, key=len, reverse=True):
+        if directory == root:
+            return ''
+        if directory.startswith(root.rstrip(os.sep) + os.sep):
+            relative = os.path.relpath(directory, root)
+            return relative.replace(os.sep, '/') + '/'
+    return ''
+
+
+class Journal:
+    """Directory checkpoint journal attached to a SqliteSink.
+
+    Without resume, the journal is emptied and the sink's output table is
+    recreated with the current columns.
+    """
+
+    def __init__(self, sink, resume: bool = False):
+        self.sink = sink
+        self.connection = sink.connection
+        self.connection.executescript(SCHEMA)
+        if not resume:
+            # A fresh run replaces the output of any earlier one, so resume
+            # never mistakes its rows for work already done.
+            self.connection.execute('BEGIN')
+            self.connection.execute('DELETE FROM journal')
+            sink.create_table(replace=True)
+            self.connection.execute('COMMIT')
+        self.connection.execute(
+            f'CREATE INDEX IF NOT EXISTS "{sink.table}_path" '
+            f'ON "{sink.table}" (path)')
+        sink.journal = self
+        self.outstanding = {}
+        self.listing = set()
+        self.resumed = set()
+        self._new: List[str] = []
+        self._done: List[str] = []
+
+    def frontier(self, *roots) -> List[str]:
+        """Return the directories still to be listed.
+
+        Directories left pending by an earlier run are resumed and roots
+        that were never started are added.
+        """
+        pending = [
+            row[0] for row in self.connection.execute(
+                'SELECT path FROM journal WHERE done = 0 ORDER BY path DESC')
+        ]
+        self.resumed = set(pending)
+        if pending:
+            logger.info(f'Resuming walk with {len(pending)} directories.')
+        for root in map(os.path.normpath, map(str, roots)):
+            if not self._known(root) and root not in self._new:
+                self._new.append(root)
+                pending.append(root)
+        return pending
+
+    def _known(self, path: str) -> bool:
+        return self.connection.execute('SELECT 1 FROM journal WHERE path = ?',
+                                       (path, )).fetchone() is not None
+
+    def _written(self, path: str) -> bool:
+        return self.connection.execute(
+            f'SELECT 1 FROM "{self.sink.table}" WHERE path = ?',
+            (path, )).fetchone() is not None
+
+    def walk(self, *roots,
+             spec: Optional[FilterSpec] = None) -> Iterator[os.DirEntry]:
+        """Yield scandir entries not yet written, resuming the frontier.
+
+        Entries rejected by spec are skipped and never descended into.
+        """
+        stack = self.frontier(*roots)
+        roots = [os.path.normpath(str(root)) for root in roots]
+        while stack:
+            directory = stack.pop()
+            resumed = directory in self.resumed
+            self.outstanding[directory] = 0
+            self.listing.add(directory)
+            if spec is not None:
+                prefix = _relative(directory, roots)
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        if spec is not None and not spec.keep_entry(
+                                entry, prefix + entry.name):
+                            continue
+                        if entry.is_dir(follow_symlinks=False) and not (
+                                resumed and self._known(entry.path)):
+                            self._new.append(entry.path)
+                            stack.append(entry.path)
+                        if resumed and self._written(entry.path):
+                            continue
+                        self.outstanding[directory] += 1
+                        yield entry
+            except OSError as error:
+                logger.warning(
+                    f'Could not list directory: {directory}\n{error}')
+            finally:
+                self.listing.discard(directory)
+                self._check(directory)
+
+    def _check(self, directory: str):
+        if (directory not in self.listing
+                and not self.outstanding.get(directory, 1)):
+            del self.outstanding[directory]
+            self._done.append(directory)
+
+    def written(self, paths: Iterable[str]):
+        """Record paths written by the current sink transaction."""
+        for path in paths:
+            directory = os.path.dirname(path)
+            if directory in self.outstanding:
+                self.outstanding[directory] -= 1
+                self._check(directory)
+        self.commit()
+
+    def commit(self):
+        """Write buffered journal changes in the current transaction."""
+        if self._new:
+            self.connection.executemany(
+                'INSERT OR IGNORE INTO journal (path) VALUES (?)',
+                ((path, ) for path in self._new))
+        if self._done:
+            self.connection.executemany(
+                'UPDATE journal SET done = 1 WHERE path = ?',
+                ((path, ) for path in self._done))
+            DBG(f'Journal: {len(self._done)} directories done')
+        self._new = []
+        self._done = []
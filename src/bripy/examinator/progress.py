@@ -0,0 +1,95 @@
+"""Throughput and per-stage timing for examinator runs."""
+from time import perf_counter
+from typing import Callable, Dict, Iterable, Iterator, Optional
+
+import click
+
+__all__ = ['Progress']
+
+INTERVAL = 1.0
+
+
+class Progress:
+    """Track exclusive time per pipeline stage and report throughput.
+
+    Stages are timed exclusively: while a stage waits on the stage that
+    feeds it, the time is charged to the feeding stage.  If pipeline is
+    set, its queue depths and per-stage throughput are reported as well.
+    """
+
+    def __init__(self,
+                 interval: Optional[float] = INTERVAL,
+                 depths: Optional[Callable[[], Dict[str, int]]] = None,
+                 hashed: Optional[Callable[[], int]] = None):
+        self.interval = interval
+        self.depths = depths
+        self.hashed = hashed
+        self.pipeline = None
+        self.stages: Dict[str, float] = {}
+        self.files = 0
+        self.start = self._mark = self._last = perf_counter()
+        self._stage = 'other'
+
+    def switch(self, stage: str) -> str:
+        """Charge elapsed time to the current stage and enter stage."""
+        now = perf_counter()
+        previous = self._stage
+        self.stages[previous] = self.stages.get(previous, 0) + now - self._mark
+        self._mark = now
+        self._stage = stage
+        return previous
+
+    def timed(self, stage: str, iterable: Iterable) -> Iterator:
+        """Wrap an iterable, charging the time spent in next() to stage."""
+        iterator = iter(iterable)
+        while True:
+            previous = self.switch(stage)
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self.switch(previous)
+            yield item
+
+    def update(self, files: int = 1):
+        """Count processed files and print a live line every interval."""
+        self.files += files
+        if self.interval is None:
+            return
+        now = perf_counter()
+        if now - self._last >= self.interval:
+            self._last = now
+            click.echo(f'\r{self.line()}', nl=False, err=True)
+
+    def line(self) -> str:
+        """Return the current throughput line."""
+        elapsed = max(perf_counter() - self.start, 1e-9)
+        line = f'{self.files} files  {self.files / elapsed:,.0f} files/s'
+        if self.hashed is not None:
+            line += f'  {self.hashed() / elapsed / 1e6:,.1f} MB/s hashed'
+        if self.depths is not None:
+            depths = ' '.join(f'{name}={depth}'
+                              for name, depth in self.depths().items())
+            line += f'  queues: {depths}'
+        if self.pipeline is not None:
+            depths = ' '.join(
+                f'{name}={depth}'
+                for name, depth in self.pipeline.queue_depths().items())
+            line += f'  batches: {depths}'
+        return line
+
+    def summary(self) -> str:
+        """Return the final per-stage timing summary."""
+        self.switch(self._stage)
+        elapsed = perf_counter() - self.start
+        lines = [self.line(), f'{"stage":>10}  {"seconds":>9}  {"share":>6}']
+        for stage, seconds in sorted(self.stages.items(),
+                                     key=lambda item: -item[1]):
+            if seconds:
+                share = seconds / elapsed if elapsed else 0
+                lines.append(f'{stage:>10}  {seconds:9.3f}  {share:6.1%}')
+        lines.append(f'{"total":>10}  {elapsed:9.3f}')
+        if self.pipeline is not None:
+            lines.append(self.pipeline.report())
+        return '\n'.join(lines)
@@ -0,0 +1,288 @@
+"""Hash stage scheduler for examinator.
+
+Stat records are produced by the walk and hashed in separate lanes, one
+thread pool per device plus a dedicated lane per device for very large
+files.  A slow device or a huge file therefore only occupies its own lane
+while every other device keeps hashing.
+
+ProcessHashScheduler is an opt-in backend for CPU-bound hashing, e.g. when
+files are already in the page cache, that hashes batches of paths in a
+process pool.
+
+Hardlinked files are hashed once per run: records with st_nlink > 1 are
+keyed by (st_dev, st_ino, st_size, st_mtime_ns), and later links reuse the
+digest of the first, or wait for it while it is still hashing.  Only a
+link count and the digest are kept per physical file, and both are dropped
+once all st_nlink links have been seen; the paths of each group are listed
+by the output database's hardlinks view.
+"""
+from concurrent.futures import (FIRST_COMPLETED, Future, ProcessPoolExecutor,
+                                ThreadPoolExecutor, wait)
+from functools import partial
+from queue import Queue
+from threading import Lock
+from typing import (Callable, Dict, Iterable, Iterator, List, Optional, Set,
+                    Tuple)
+
+from bripy.bllb.file import (BLOCKSIZE, DEFAULT_ALGORITHM, get_hash_cache,
+                             hash_batch, hash_blocks)
+from bripy.bllb.fs import set_digest
+from bripy.bllb.logging import logger, DBG
+
+__all__ = ['HashScheduler', 'ProcessHashScheduler', 'link_key']
+
+DEVICE_WORKERS = 4
+LARGE_WORKERS = 1
+LARGE_FILE = 1024 * 1024 * 1024
+MAX_PENDING = 1000
+BATCH_SIZE = 64
+
+LinkKey = Tuple[int, int, int, int]
+
+
+def link_key(record: dict) -> Optional[LinkKey]:
+    """Return the physical file key of a hardlinked record, else None."""
+    if (record.get('st_nlink') or 1) < 2:
+        return None
+    return (record.get('st_dev'), record.get('st_ino'), record.get('st_size'),
+            record.get('st_mtime_ns'))
+
+
+class HashScheduler:
+    """Hash file records with per-device concurrency limits.
+
+    device_workers: concurrent hashes of ordinary files per device.
+    large_workers: concurrent hashes of files of at least large_file bytes
+        per device, run in their own lane.
+    max_pending: maximum records queued or hashing at once, which bounds
+        memory while the walk runs ahead.
+    """
+
+    def __init__(self,
+                 algorithm: str = DEFAULT_ALGORITHM,
+                 device_workers: int = DEVICE_WORKERS,
+                 large_workers: int = LARGE_WORKERS,
+                 large_file: int = LARGE_FILE,
+                 max_pending: int = MAX_PENDING,
+                 hasher: Optional[Callable] = None):
+        self.algorithm = algorithm
+        self.device_workers = device_workers
+        self.large_workers = large_workers
+        self.large_file = large_file
+        self.max_pending = max_pending
+        self.hasher = hasher or partial(hash_blocks, algorithm=algorithm)
+        self.lanes: Dict[Tuple[int, bool], ThreadPoolExecutor] = {}
+        self.lane_futures: Dict[Tuple[int, bool], Set[Future]] = {}
+        self.lanes_lock = Lock()
+        self.pending = 0
+        self.files_hashed = 0
+        self.bytes_hashed = 0
+        self.files_linked = 0
+        self.link_groups = 0
+        self.digests: Dict[LinkKey, str] = {}
+        self.link_counts: Dict[LinkKey, int] = {}
+        self._waiting: Dict[LinkKey, List[dict]] = {}
+        self._done = Queue()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def lane(self, device: int, large: bool) -> ThreadPoolExecutor:
+        """Return the executor for a device and file size class."""
+        key = (device, large)
+        with self.lanes_lock:
+            if key not in self.lanes:
+                workers = self.large_workers if large else self.device_workers
+                name = f'hash-{device}{"-large" if large else ""}'
+                DBG(f'Starting hash lane {name} with {workers} workers')
+                self.lanes[key] = ThreadPoolExecutor(max_workers=workers,
+                                                     thread_name_prefix=name)
+                self.lane_futures[key] = set()
+            return self.lanes[key]
+
+    def queue_depths(self) -> Dict[str, int]:
+        """Return submitted but unfinished hashes per lane.
+
+        Safe to call from another thread while lanes are being added.
+        """
+        with self.lanes_lock:
+            lanes = list(self.lane_futures.items())
+        return {
+            f'{device}{"-large" if large else ""}': len(futures)
+            for (device, large), futures in lanes
+        }
+
+    def _hash(self, record: dict):
+        try:
+            digest = self.hasher(record['path'])
+            if digest is not None:
+                set_digest(record, digest, self.algorithm)
+        except Exception as error:
+            logger.warning(f'Could not hash item: {record["path"]}\n{error}')
+        finally:
+            self._done.put(record)
+
+    def submit(self, record: dict):
+        """Queue one file record in the lane for its device and size."""
+        size = record.get('st_size') or 0
+        key = (record.get('st_dev', 0), size >= self.large_file)
+        lane = self.lane(*key)
+        self.pending += 1
+        future = lane.submit(self._hash, record)
+        futures = self.lane_futures[key]
+        futures.add(future)
+        future.add_done_callback(futures.discard)
+
+    def _completed(self, block: bool = False) -> Iterator[dict]:
+        while self.pending and (block or not self._done.empty()):
+            self.pending -= 1
+            record = self._done.get()
+            if 'digest' in record:
+                self.files_hashed += 1
+                self.bytes_hashed += record.get('st_size') or 0
+            yield from self._finished(record)
+            block = False
+
+    def _finished(self, record: dict) -> Iterator[dict]:
+        """Yield a hashed record and any links that waited for it."""
+        yield record
+        key = link_key(record)
+        if key is None:
+            return
+        digest = record.get('digest')
+        if digest is not None:
+            self.digests[key] = digest
+        for linked in self._waiting.pop(key, ()):
+            if digest is not None:
+                set_digest(linked, digest, self.algorithm)
+                self.files_linked += 1
+            yield linked
+        self._forget(key, record)
+
+    def _forget(self, key: LinkKey, record: dict):
+        """Drop the state of a physical file once all its links were seen."""
+        if self.link_counts.get(key, 0) >= record['st_nlink']:
+            del self.link_counts[key]
+            self.digests.pop(key, None)
+
+    def run(self, records: Iterable[dict]) -> Iterator[dict]:
+        """Hash regular files in records, yielding records as they finish.
+
+        Records that are not regular files pass straight through, and links
+        to a file already hashed in this run reuse its digest.  Output
+        order is not preserved.
+        """
+        for record in records:
+            yield from self._completed()
+            if not record.get('is_file'):
+                yield record
+                continue
+            key = link_key(record)
+            if key is not None:
+                count = self.link_counts.get(key, 0) + 1
+                self.link_counts[key] = count
+                if count == 2:
+                    self.link_groups += 1
+                if key in self.digests:
+                    set_digest(record, self.digests[key], self.algorithm)
+                    self.files_linked += 1
+                    self._forget(key, record)
+                    yield record
+                    continue
+                if key in self._waiting:
+                    # The first link is still hashing, wait for its digest.
+                    self._waiting[key].append(record)
+                    continue
+                self._waiting[key] = []
+            while self.pending >= self.max_pending:
+                yield from self._completed(block=True)
+            self.submit(record)
+        while self.pending:
+            yield from self._completed(block=True)
+
+    def close(self):
+        """Shut down all lanes."""
+        with self.lanes_lock:
+            executors = list(self.lanes.values())
+            self.lanes.clear()
+            self.lane_futures.clear()
+        for executor in executors:
+            executor.shutdown()
+
+
+class ProcessHashScheduler(HashScheduler):
+    """Hash file records in batches on a process pool.
+
+    Only (path_id, path) tuples are sent to the workers and (path_id,
+    digest) tuples come back; the records themselves stay in this process.
+    Workers open the active hash cache by its database path.
+    """
+
+    def __init__(self,
+                 algorithm: str = DEFAULT_ALGORITHM,
+                 workers: Optional[int] = None,
+                 batch_size: int = BATCH_SIZE,
+                 max_pending: int = MAX_PENDING):
+        super().__init__(algorithm=algorithm, max_pending=max_pending)
+        self.batch_size = batch_size
+        self.executor = ProcessPoolExecutor(max_workers=workers)
+        self.futures = set()
+        self._records: Dict[int, dict] = {}
+        self._batch = []
+        self._next_id = 0
+
+    def queue_depths(self) -> Dict[str, int]:
+        """Return batches submitted but not finished."""
+        return {'process': len(self.futures)}
+
+    def submit(self, record: dict):
+        """Add one file record to the current batch."""
+        path_id = self._next_id
+        self._next_id += 1
+        self._records[path_id] = record
+        self._batch.append((path_id, record['path']))
+        self.pending += 1
+        if len(self._batch) >= self.batch_size:
+            self._submit_batch()
+
+    def _submit_batch(self):
+        if self._batch:
+            cache = get_hash_cache()
+            if cache is not None:
+                # Release the write lock before workers store digests.
+                cache.commit()
+            self.futures.add(
+                self.executor.submit(hash_batch, self._batch, self.algorithm,
+                                     BLOCKSIZE,
+                                     cache and cache.database))
+            self._batch = []
+
+    def _completed(self, block: bool = False) -> Iterator[dict]:
+        if block:
+            self._submit_batch()
+        if not self.futures:
+            return
+        done, self.futures = wait(self.futures,
+                                  timeout=None if block else 0,
+                                  return_when=FIRST_COMPLETED)
+        for future in done:
+            try:
+                results = future.result()
+            except Exception as error:
+                logger.error(f'Hash batch failed: {error}')
+                raise
+            for path_id, digest in results:
+                record = self._records.pop(path_id)
+                self.pending -= 1
+                if digest is not None:
+                    set_digest(record, digest, self.algorithm)
+                    self.files_hashed += 1
+                    self.bytes_hashed += record.get('st_size') or 0
+                yield from self._finished(record)
+
+    def close(self):
+        """Shut down the process pool."""
+        self.executor.shutdown()
@@ -0,0 +1,212 @@
+"""Streaming, batched output sinks for examinator records.
+
+Records are buffered into fixed-size column batches and each full batch is
+written out immediately, so memory stays flat regardless of tree size and
+every flushed batch survives a crash.
+"""
+from abc import ABC, abstractmethod
+from datetime import datetime
+import os
+from pathlib import Path
+import sqlite3
+from typing import Dict, Iterable, List, Sequence
+
+from bripy.bllb.fs import STAT_COLUMNS
+from bripy.bllb.logging import logger, DBG
+
+__all__ = ['BatchSink', 'SqliteSink', 'ParquetSink', 'DEFAULT_COLUMNS']
+
+DEFAULT_COLUMNS = (*STAT_COLUMNS, 'digest', 'hash_algorithm')
+BATCH_SIZE = 10000
+LINK_COLUMNS = ('path', 'is_file', 'st_dev', 'st_ino', 'st_nlink')
+HARDLINKS_VIEW = """
+CREATE VIEW IF NOT EXISTS "{table}_hardlinks" AS
+SELECT st_dev, st_ino, count(*) AS links,
+       group_concat(path, char(10)) AS paths
+FROM "{table}"
+WHERE st_nlink > 1 AND is_file
+GROUP BY st_dev, st_ino
+HAVING count(*) > 1
+"""
+
+
+def column_type(column: str) -> str:
+    """Return the SQLite column type for a record column."""
+    if column.startswith('f_'):
+        return 'TEXT'
+    if column.endswith('time'):
+        return 'REAL'
+    if column.startswith(('st_', 'is_')):
+        return 'INTEGER'
+    return 'TEXT'
+
+
+class BatchSink(ABC):
+    """Collect records into column batches and write each full batch.
+
+    Subclasses implement write_batch.
+    """
+
+    def __init__(self,
+                 columns: Sequence[str] = DEFAULT_COLUMNS,
+                 batch_size: int = BATCH_SIZE):
+        self.columns = tuple(columns)
+        self.batch_size = batch_size
+        self.total = 0
+        self.batches = 0
+        self._reset()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _reset(self):
+        self.data: Dict[str, List] = {column: [] for column in self.columns}
+        self.size = 0
+
+    def add(self, record: dict):
+        """Append one record, flushing when the batch is full."""
+        for column, values in self.data.items():
+            values.append(record.get(column))
+        self.size += 1
+        if self.size >= self.batch_size:
+            self.flush()
+
+    def extend(self, records: Iterable[dict]):
+        """Append many records."""
+        for record in records:
+            self.add(record)
+
+    def flush(self):
+        """Write the buffered batch, if any."""
+        if not self.size:
+            return
+        self.write_batch(self.data, self.size)
+        self.total += self.size
+        self.batches += 1
+        DBG(f'Flushed batch {self.batches}: {self.size} records')
+        self._reset()
+
+    @abstractmethod
+    def write_batch(self, data: Dict[str, List], size: int):
+        """Write size records given as columns of values."""
+
+    def close(self):
+        """Flush remaining records."""
+        self.flush()
+
+
+class SqliteSink(BatchSink):
+    """Write record batches to SQLite with executemany.
+
+    Each batch is inserted inside its own transaction.
+    """
+
+    def __init__(self,
+                 database='output.db',
+                 table: str = 'files',
+                 columns: Sequence[str] = DEFAULT_COLUMNS,
+                 batch_size: int = BATCH_SIZE):
+        super().__init__(columns, batch_size)
+        self.database = str(database)
+        self.table = table
+        self.connection = sqlite3.connect(self.database,
+                                          isolation_level=None)
+        self.create_table()
+        names = ', '.join(f'"{column}"' for column in self.columns)
+        params = ', '.join('?' * len(self.columns))
+        self.statement = f'INSERT INTO "{table}" ({names}) VALUES ({params})'
+        self.journal = None
+
+    def create_table(self, replace: bool = False):
+        """Create the output table, dropping an existing one if replace."""
+        if replace:
+            self.connection.execute(f'DROP TABLE IF EXISTS "{self.table}"')
+        definition = ', '.join(f'"{column}" {column_type(column)}'
+                               for column in self.columns)
+        self.connection.execute(
+            f'CREATE TABLE IF NOT EXISTS "{self.table}" ({definition})')
+        if set(LINK_COLUMNS) <= set(self.columns):
+            self.connection.execute(HARDLINKS_VIEW.format(table=self.table))
+
+    def write_batch(self, data, size):
+        values = [[_sql_value(value) for value in data[column]]
+                  for column in self.columns]
+        self.connection.execute('BEGIN')
+        try:
+            self.connection.executemany(self.statement, zip(*values))
+            if self.journal is not None:
+                self.journal.written(data['path'])
+        except Exception:
+            self.connection.execute('ROLLBACK')
+            raise
+        self.connection.execute('COMMIT')
+
+    def close(self):
+        if self.connection is None:
+            return
+        try:
+            super().close()
+            if self.journal is not None:
+                self.connection.execute('BEGIN')
+                self.journal.commit()
+                self.connection.execute('COMMIT')
+        finally:
+            self.connection.close()
+            self.connection = None
+
+
+class ParquetSink(BatchSink):
+    """Write each record batch as its own Parquet file.
+
+    path is a dataset directory of ``part-NNNNNN.parquet`` files, readable
+    with ``pandas.read_parquet(path)``.  A Parquet file is only readable
+    once its footer is written, so every batch is a complete file, renamed
+    into place.  Parts of an earlier run are removed.  Requires pyarrow.
+    """
+
+    def __init__(self,
+                 path='output.parquet',
+                 columns: Sequence[str] = DEFAULT_COLUMNS,
+                 batch_size: int = BATCH_SIZE):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as error:
+            logger.error('ParquetSink requires pyarrow.')
+            raise error
+        super().__init__(columns, batch_size)
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        for part in self.path.glob('part-*.parquet'):
+            part.unlink()
+        self.pa = pa
+        self.pq = pq
+        self.schema = pa.schema([(column, self.arrow_type(column))
+                                 for column in self.columns])
+
+    def arrow_type(self, column: str):
+        """Return the Arrow type for a record column."""
+        if column.startswith('f_'):
+            return self.pa.timestamp('us')
+        if column.startswith('is_'):
+            return self.pa.bool_()
+        return {
+            'INTEGER': self.pa.int64(),
+            'REAL': self.pa.float64(),
+        }.get(column_type(column), self.pa.string())
+
+    def write_batch(self, data, size):
+        table = self.pa.table(data, schema=self.schema)
+        part = self.path / f'part-{self.batches:06d}.parquet'
+        temporary = part.with_suffix('.tmp')
+        self.pq.write_table(table, str(temporary))
+        os.replace(temporary, part)
+
+
+def _sql_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat(sep=' ')
+    return value
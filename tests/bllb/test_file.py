@@ -44,3 +44,56 @@ def test_lines():
     line1b = get_lines(__file__, 0)[0]
     line1c = list(try_read(__file__))[0].split("\n")[0]
     assert line1a == line1b == line1c
+
+
+@pytest.mark.parametrize("algorithm", ['md5', 'sha1', 'blake2b'])
+def test_hash_blocks(tmp_file, algorithm):
+    """Test block hashing matches hashlib for several algorithms."""
+    import hashlib
+    expected = hashlib.new(algorithm, TEST_TEXT.encode()).hexdigest()
+    assert hash_blocks(tmp_file, algorithm, blocksize=7) == expected
+    assert hash_blocks_fs(str(tmp_file), algorithm, blocksize=7) == expected
+
+
+def test_hash_blocks_xxhash(tmp_file):
+    """Test xxh3 hashing when xxhash is installed."""
+    xxhash = pytest.importorskip('xxhash')
+    expected = xxhash.xxh3_64(TEST_TEXT.encode()).hexdigest()
+    assert hash_blocks(tmp_file, 'xxh3') == expected
+    assert 'xxh3_64' in available_algorithms()
+
+
+def test_md5_blocks(tmp_file):
+    """Test md5 helpers keep working."""
+    assert md5_blocks(tmp_file) == md5_blocks_fs(str(tmp_file))
+    assert md5_blocks(Path(tmp_file).parent) is None
+
+
+def test_hash_blocks_mmap(tmp_path):
+    """Test memory mapped hashing matches buffered hashing."""
+    path = tmp_path / 'big.bin'
+    path.write_bytes(bytes(range(256)) * 1000)
+    buffered = hash_blocks(path, 'sha1', mmap_threshold=None)
+    assert hash_blocks(path, 'sha1', blocksize=1000,
+                       mmap_threshold=0) == buffered
+    with path.open('rb') as file:
+        assert hash_mmap(file, 'sha1', blocksize=1000) == buffered
+    empty = tmp_path / 'empty.bin'
+    empty.write_bytes(b'')
+    assert hash_blocks(empty, mmap_threshold=0) == md5_blocks(empty)
+
+
+def test_hash_blocks_pipe(tmp_path):
+    """Test pipes fall back to buffered reads."""
+    import hashlib
+    import os
+    import threading
+    if not hasattr(os, 'mkfifo'):
+        pytest.skip('mkfifo not available')
+    fifo = tmp_path / 'fifo'
+    os.mkfifo(fifo)
+    writer = threading.Thread(target=fifo.write_text, args=(TEST_TEXT, ))
+    writer.start()
+    digest = hash_blocks(fifo, mmap_threshold=0)
+    writer.join()
+    assert digest == hashlib.md5(TEST_TEXT.encode()).hexdigest()
@@ -0,0 +1,100 @@
+"""Test bllb filter."""
+import os
+
+import pytest
+
+from bripy.bllb.filter import *
+from bripy.bllb.fs import walk_entries, walk_fs
+
+
+@pytest.mark.parametrize('patterns, relative, is_dir, excluded', [
+    (['*.log'], 'a.log', False, True),
+    (['*.log'], 'sub/a.log', False, True),
+    (['*.log', '!keep.log'], 'sub/keep.log', False, False),
+    (['!keep.log', '*.log'], 'keep.log', False, True),
+    (['build/'], 'build', True, True),
+    (['build/'], 'build', False, False),
+    (['/top.txt'], 'top.txt', False, True),
+    (['/top.txt'], 'sub/top.txt', False, False),
+    (['docs/*.md'], 'docs/a.md', False, True),
+    (['docs/*.md'], 'docs/sub/a.md', False, False),
+    (['**/cache'], 'a/b/cache', True, True),
+    (['a/**/z'], 'a/z', False, True),
+    (['a/**/z'], 'a/b/c/z', False, True),
+    (['data/**'], 'data/x/y', False, True),
+    (['file[0-9].txt'], 'file3.txt', False, True),
+    (['file[!0-9].txt'], 'file3.txt', False, False),
+    (['# comment', '', 'x'], 'x', False, True),
+    (['\\#hash'], '#hash', False, True),
+    ([], 'anything', False, False),
+])
+def test_excluded(patterns, relative, is_dir, excluded):
+    """Test gitignore-style pattern semantics."""
+    assert FilterSpec(patterns).excluded(relative, is_dir) is excluded
+
+
+def test_bounds():
+    """Test size, mtime and extension bounds apply to files only."""
+    spec = FilterSpec(min_size=2, max_size=10, newer_than=100,
+                      older_than=200, extensions=['JPG', '.png'])
+    assert spec.keep('a.jpg', False, 5, 150)
+    assert spec.keep('a.PNG', False, 5, 150)
+    assert not spec.keep('a.gif', False, 5, 150)
+    assert not spec.keep('a.jpg', False, 1, 150)
+    assert not spec.keep('a.jpg', False, 11, 150)
+    assert not spec.keep('a.jpg', False, 5, 99)
+    assert not spec.keep('a.jpg', False, 5, 201)
+    assert spec.keep('dir', True, 4096, 0)
+    assert spec.keep_info({'type': 'file', 'size': 5, 'mtime': 150},
+                          'x/a.jpg')
+
+
+def test_keep_path():
+    """Test keep_path checks the parent directories as well."""
+    spec = FilterSpec(['build/', '!*.keep'], max_size=10)
+    assert spec.keep_path('src/a.py', False, 5)
+    assert not spec.keep_path('build/x/a.keep', False, 5)
+    assert not spec.keep_path('src/a.py', False, 50)
+    assert spec.keep_path('src', True)
+
+
+@pytest.fixture
+def tree(tmp_path):
+    """Create a tree with directories to prune."""
+    for d in ('.git/objects', 'node_modules/pkg', 'src/sub'):
+        (tmp_path / d).mkdir(parents=True)
+    for f in ('.git/objects/x', 'node_modules/pkg/index.js', 'src/a.py',
+              'src/sub/b.py', 'src/big.py', 'notes.log'):
+        (tmp_path / f).write_text('x')
+    (tmp_path / 'src' / 'big.py').write_text('x' * 100)
+    return tmp_path
+
+
+def test_walkers_prune(tree, tmp_path, monkeypatch):
+    """Test local and fsspec walkers prune excluded subtrees."""
+    spec = FilterSpec([*DEFAULT_EXCLUDES, '*.log'], max_size=10)
+    listed = []
+    scandir = os.scandir
+
+    def tracking(path):
+        listed.append(os.path.relpath(path, tree))
+        return scandir(path)
+
+    monkeypatch.setattr(os, 'scandir', tracking)
+    local = sorted(
+        os.path.relpath(entry.path, tree)
+        for entry in walk_entries(str(tree), spec))
+    assert local == ['src', 'src/a.py', 'src/sub', 'src/sub/b.py']
+    assert sorted(listed) == ['.', 'src', 'src/sub']
+    remote = sorted(walk_fs(str(tree), withdirs=True, spec=spec))
+    assert remote == [f'file://{tree / path}' for path in local]
+
+
+def test_from_file(tmp_path):
+    """Test loading patterns from a gitignore file."""
+    path = tmp_path / '.gitignore'
+    path.write_text('# build output\nbuild/\n*.o\n!keep.o\n')
+    spec = FilterSpec.from_file(path)
+    assert spec.excluded('build', True)
+    assert spec.excluded('x.o')
+    assert not spec.excluded('keep.o')
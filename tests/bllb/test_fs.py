@@ -0,0 +1,119 @@
+"""Test bllb fs."""
+import pytest
+from fsspec.implementations.local import LocalFileSystem
+
+from bripy.bllb.fs import *
+
+
+@pytest.fixture
+def tree(tmp_path):
+    """Create a small tree to walk."""
+    base = tmp_path / 'tree'
+    (base / 'sub').mkdir(parents=True)
+    (base / 'a.txt').write_text('a')
+    (base / 'sub' / 'b.txt').write_text('bb')
+    return base
+
+
+def test_get_stat(tree):
+    """Test fixed schema of get_stat."""
+    path = tree / 'a.txt'
+    info = get_stat(path)
+    assert set(STAT_COLUMNS) <= set(info)
+    assert info['path'] == str(path)
+    assert info['st_size'] == 1
+    assert info['st_blocks'] == path.lstat().st_blocks
+    assert info['st_mtime_ns'] == path.lstat().st_mtime_ns
+    assert info['is_file'] and not info['is_dir']
+    assert info['suffix'] == '.txt'
+    assert info['md5'] == '0cc175b9c0f1b6a831c399e269772661'
+
+
+def test_scan_stat(tree):
+    """Test scandir driven records match get_stat."""
+    records = {info['path']: info for info in scan_stat(tree)}
+    assert sorted(records) == sorted(
+        map(str, [tree / 'a.txt', tree / 'sub', tree / 'sub' / 'b.txt']))
+    for path, info in records.items():
+        expected = get_stat(path, opt_md5=False)
+        assert tuple(info) == STAT_COLUMNS
+        for key in ('st_atime', 'st_atime_ns', 'f_st_atime'):
+            del info[key], expected[key]
+        assert info == expected
+
+
+def test_get_stat_algorithm(tree):
+    """Test digests are tagged with the algorithm used."""
+    info = get_stat(tree / 'a.txt', algorithm='sha1')
+    assert info['hash_algorithm'] == 'sha1'
+    assert info['digest'] == '86f7e437faa5a7fce15d1ddcb9eaeaea377667b8'
+    assert 'md5' not in info
+
+
+def test_ls_info(tree):
+    """Test detailed listing returns info dicts with URL names."""
+    infos = {info['name']: info for info in ls_info(str(tree))}
+    assert set(infos) == {f'file://{tree / "a.txt"}', f'file://{tree / "sub"}'}
+    assert infos[f'file://{tree / "sub"}']['type'] == 'directory'
+    assert infos[f'file://{tree / "a.txt"}']['size'] == 1
+
+
+def test_find_info(tree):
+    """Test recursive detailed listing."""
+    names = sorted(info['name'] for info in find_info(str(tree)))
+    assert names == [
+        f'file://{tree / "a.txt"}',
+        f'file://{tree / "sub" / "b.txt"}',
+    ]
+
+
+def test_get_stat_fs_info(tree, monkeypatch):
+    """Test a pre-fetched info dict avoids per-entry info requests."""
+    infos = find_info(str(tree))
+    fs = LocalFileSystem()
+
+    def fail(*args, **kwargs):
+        raise AssertionError('unexpected request')
+
+    monkeypatch.setattr(fs, 'info', fail)
+    monkeypatch.setattr(fs, 'isdir', fail)
+    records = [get_stat_fs(info['name'], True, fs=fs, info=info)
+               for info in infos]
+    assert sorted(record['size'] for record in records) == [1, 2]
+    assert all(record['md5'] for record in records)
+
+
+def test_walk_fs(tree):
+    """Test the streaming walker yields files depth-first with URL names."""
+    (tree / '.hidden').mkdir()
+    (tree / '.hidden' / 'c.txt').write_text('c')
+    (tree / 'sub' / 'skip.log').write_text('log')
+    walker = walk_fs(str(tree))
+    assert next(walker).startswith('file://')
+    files = sorted(walk_fs(str(tree)))
+    assert files == sorted(f'file://{tree / name}' for name in (
+        'a.txt', '.hidden/c.txt', 'sub/b.txt', 'sub/skip.log'))
+    assert sorted(walk_fs(str(tree), skip_hidden=True,
+                          exclude=['*.log'])) == [
+                              f'file://{tree / "a.txt"}',
+                              f'file://{tree / "sub" / "b.txt"}'
+                          ]
+    assert sorted(walk_fs(str(tree), exclude=['sub'], skip_hidden=True,
+                          withdirs=True)) == [f'file://{tree / "a.txt"}']
+    assert sorted(walk_fs(str(tree), maxdepth=1, withdirs=True,
+                          skip_hidden=True)) == [
+                              f'file://{tree / "a.txt"}',
+                              f'file://{tree / "sub"}'
+                          ]
+    infos = list(walk_fs(str(tree), detail=True, skip_mounts=True,
+                         prune=lambda info: info['type'] == 'file' and
+                         info['size'] > 2))
+    assert sorted(info['size'] for info in infos) == [1, 1, 2]
+
+
+def test_rglob(tree):
+    """Test rglob streams files and directories below path."""
+    assert sorted(rglob(str(tree))) == sorted(
+        f'file://{path}' for path in tree.rglob('*'))
+    path = str(tree / 'a.txt')
+    assert rglob(path) == path
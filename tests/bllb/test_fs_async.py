@@ -0,0 +1,110 @@
+"""Test bllb fs_async."""
+import asyncio
+
+import pytest
+from fsspec.asyn import AsyncFileSystem
+from fsspec.implementations.local import LocalFileSystem
+
+from bripy.bllb import fs_async
+from bripy.bllb.file import hash_blocks
+from bripy.bllb.fs_async import *
+
+
+class SlowFileSystem(AsyncFileSystem):
+    """Local files behind a fixed round trip, counting requests in flight."""
+    protocol = 'slow'
+    cachable = False
+
+    def __init__(self, latency=0.02, **kwargs):
+        super().__init__(**kwargs)
+        self.latency = latency
+        self.local = LocalFileSystem()
+        self.in_flight = self.max_in_flight = 0
+
+    async def _call(self, method, *args, **kwargs):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency)
+            return getattr(self.local, method)(*args, **kwargs)
+        finally:
+            self.in_flight -= 1
+
+    async def _info(self, path, **kwargs):
+        return await self._call('info', path)
+
+    async def _ls(self, path, detail=True, **kwargs):
+        return await self._call('ls', path, detail=detail)
+
+    async def _cat_file(self, path, start=None, end=None, **kwargs):
+        return await self._call('cat_file', path, start=start, end=end)
+
+
+@pytest.fixture
+def tree(tmp_path):
+    """Create a tree of small files."""
+    for d in range(4):
+        (tmp_path / f'd{d}').mkdir()
+        for f in range(5):
+            (tmp_path / f'd{d}' / f'{f}.bin').write_bytes(bytes([f]) * 100 * f)
+    return tmp_path
+
+
+def test_inventory(tree):
+    """Test every file is statted and hashed through the async path."""
+    fs = SlowFileSystem()
+    records = inventory(str(tree), opt_md5=True, concurrency=8, fs=fs)
+    paths = sorted(str(path) for path in tree.rglob('*.bin'))
+    assert sorted(record['name'] for record in records) == paths
+    for record in records:
+        assert record['md5'] == hash_blocks(record['name'])
+        assert record['protocol'] == 'slow'
+    assert 1 < fs.max_in_flight <= 8
+
+
+def test_hash_paths(tree):
+    """Test digests come back in order with ranged reads."""
+    fs = SlowFileSystem(latency=0)
+    paths = sorted(str(path) for path in tree.rglob('*.bin'))
+    missing = str(tree / 'missing.bin')
+    digests = hash_paths([*paths, missing], 'sha1', fs=fs)
+    assert digests == [hash_blocks(path, 'sha1') for path in paths] + [None]
+
+
+def test_hash_file_ranges(tmp_path):
+    """Test files larger than a block are read in ranges."""
+    path = tmp_path / 'large.bin'
+    path.write_bytes(bytes(range(256)) * 40)
+    fs = SlowFileSystem(latency=0)
+
+    async def run():
+        return await hash_file_async(fs, str(path), asyncio.Semaphore(2),
+                                     blocksize=1000)
+
+    assert asyncio.run(run()) == hash_blocks(str(path))
+
+
+def test_inventory_bounded(tree, monkeypatch):
+    """Test at most concurrency files are being statted at any time."""
+    active, peak = [0], [0]
+
+    async def counted(*args, **kwargs):
+        active[0] += 1
+        peak[0] = max(peak[0], active[0])
+        try:
+            return await stat_async(*args, **kwargs)
+        finally:
+            active[0] -= 1
+
+    monkeypatch.setattr(fs_async, 'stat_async', counted)
+    records = inventory(str(tree), opt_md5=True, concurrency=3,
+                        fs=SlowFileSystem(0.001))
+    assert len(records) == 20
+    assert peak[0] == 3
+
+
+def test_sync_filesystem(tree):
+    """Test synchronous filesystems are wrapped."""
+    records = inventory(str(tree), concurrency=4)
+    assert len(records) == 20
+    assert as_async(LocalFileSystem()).async_impl
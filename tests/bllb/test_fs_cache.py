@@ -0,0 +1,66 @@
+"""Test bllb fs_cache."""
+from fsspec import register_implementation
+from fsspec.implementations.local import LocalFileSystem
+from fsspec.implementations.memory import MemoryFileSystem
+
+from bripy.bllb.file import hash_blocks, hash_blocks_fs
+from bripy.bllb.fs import get_stat_fs, is_dir, is_file, rglob
+from bripy.bllb.fs_cache import *
+
+
+def test_get_fs_cached(tmp_path):
+    """Test one filesystem instance is reused per protocol."""
+    clear_fs_cache()
+    fs, path = get_fs(str(tmp_path))
+    assert isinstance(fs, LocalFileSystem)
+    assert path == fs._strip_protocol(str(tmp_path))
+    assert get_fs(f'file://{tmp_path}')[0] is fs
+    assert get_filesystem('file') is fs
+    memory, path = get_fs('memory://bucket/key')
+    assert isinstance(memory, MemoryFileSystem)
+    assert path == '/bucket/key'
+
+
+class HostFileSystem(MemoryFileSystem):
+    protocol = 'hostmem'
+
+    def __init__(self, host=None, port=None, **kwargs):
+        super().__init__(**kwargs)
+        self.host = host
+        self.port = port
+
+    @staticmethod
+    def _get_kwargs_from_urls(path):
+        host, _, port = path.split('://', 1)[1].split('/', 1)[0].partition(':')
+        return {'host': host, 'port': int(port) if port else None}
+
+
+def test_get_fs_url_options():
+    """Test host and port in the URL reach the filesystem and its key."""
+    register_implementation('hostmem', HostFileSystem, clobber=True)
+    clear_fs_cache()
+    fs, _ = get_fs('hostmem://one:2121/x', skip_instance_cache=True)
+    assert (fs.host, fs.port) == ('one', 2121)
+    other, _ = get_fs('hostmem://two/x', skip_instance_cache=True)
+    assert (other.host, other.port) == ('two', None)
+    assert get_fs('hostmem://one:2121/y', skip_instance_cache=True)[0] is fs
+    assert get_fs('hostmem://one:2121/y', port=21,
+                  skip_instance_cache=True)[0].port == 21
+
+
+def test_get_filesystem_unhashable():
+    """Test unhashable storage options fall back to an uncached filesystem."""
+    fs = get_filesystem('memory', skip_instance_cache=True, extra=[1])
+    assert isinstance(fs, MemoryFileSystem)
+
+
+def test_helpers_with_fs(tmp_path):
+    """Test helpers accept an already resolved filesystem."""
+    (tmp_path / 'a.txt').write_bytes(b'abc')
+    fs, _ = get_fs(str(tmp_path))
+    path = str(tmp_path / 'a.txt')
+    assert is_dir(str(tmp_path), fs=fs)
+    assert is_file(path, fs=fs)
+    assert hash_blocks_fs(path, fs=fs) == hash_blocks(path)
+    assert get_stat_fs(path, opt_md5=True, fs=fs)['md5'] == hash_blocks(path)
+    assert f'file://{path}' in set(rglob(str(tmp_path), fs=fs))
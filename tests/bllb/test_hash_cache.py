@@ -0,0 +1,80 @@
+"""Test bllb hash_cache."""
+import os
+
+import pytest
+from fsspec.implementations.memory import MemoryFileSystem
+
+import bripy.bllb.file as file
+from bripy.bllb.file import (hash_batch, hash_blocks, hash_blocks_fs,
+                             set_hash_cache)
+from bripy.bllb.hash_cache import *
+
+
+@pytest.fixture
+def cache(tmp_path):
+    """Activate a hash cache for the test."""
+    with HashCache(tmp_path / 'hashes.db') as cache:
+        previous = set_hash_cache(cache)
+        yield cache
+        set_hash_cache(previous)
+
+
+@pytest.fixture
+def no_reads(monkeypatch):
+    """Fail on any content read."""
+
+    def fail(*args, **kwargs):
+        raise AssertionError('content read')
+
+    def deny():
+        monkeypatch.setattr(file, 'hash_file', fail)
+        monkeypatch.setattr(file, 'hash_mmap', fail)
+
+    return deny
+
+
+def test_local_cache(cache, tmp_path, no_reads):
+    """Test an unchanged file is not read a second time."""
+    path = tmp_path / 'a.txt'
+    path.write_text('abc')
+    digest = hash_blocks(path)
+    assert cache.misses == 1
+    no_reads()
+    assert hash_blocks(path) == digest
+    assert hash_batch([(0, str(path))]) == [(0, digest)]
+    assert cache.hits == 2
+
+
+def test_local_cache_invalidated(cache, tmp_path):
+    """Test a changed file is hashed again."""
+    path = tmp_path / 'a.txt'
+    path.write_text('abc')
+    hash_blocks(path)
+    path.write_text('abcd')
+    os.utime(path, ns=(0, 10**9))
+    assert hash_blocks(path) == hash_blocks(path, cache=None,
+                                            mmap_threshold=None)
+    assert hash_blocks(path, 'sha1') != hash_blocks(path)
+
+
+def test_remote_cache(cache, no_reads):
+    """Test fsspec files are cached by protocol, path, version and size."""
+    fs = MemoryFileSystem()
+    fs.pipe('/cache/a.bin', b'abc')
+    info = dict(fs.info('/cache/a.bin'), mtime=1.0)
+    digest = hash_blocks_fs('/cache/a.bin', fs=fs, info=info)
+    no_reads()
+    assert hash_blocks_fs('/cache/a.bin', fs=fs, info=info) == digest
+    assert cache.get_remote('memory', '/cache/a.bin', info, 'md5') == digest
+    assert cache.get_remote('memory', '/cache/a.bin', dict(info, mtime=2.0),
+                            'md5') is None
+
+
+def test_hash_batch_cache(tmp_path):
+    """Test worker batches store and commit digests by database path."""
+    database = str(tmp_path / 'hashes.db')
+    path = tmp_path / 'a.txt'
+    path.write_text('abc')
+    results = hash_batch([(1, str(path))], cache=database)
+    with HashCache(database) as cache:
+        assert cache.get(os.stat(path), 'md5') == results[0][1]
@@ -55,3 +55,10 @@ def test_cat_auto(test_case):
 def test_listerine_str():
     """Test listerine with simple string."""
     assert listerine('abc') == ['abc']
+
+
+def test_chunks(RANGES):
+    """Test chunks keeps order and limits chunk size."""
+    chunked = [*chunks(iter(RANGES), 4)]
+    assert [*map(len, chunked)] == [4, 4, 2]
+    assert reduce_iconcat(chunked) == RANGES
@@ -0,0 +1,311 @@
+"""Test bllb q."""
+import asyncio
+from multiprocessing import get_context
+import pickle
+from queue import Queue
+from threading import Thread
+from time import perf_counter, sleep
+
+import pytest
+
+from bripy.bllb.q import *
+
+
+def produce(q, items, stop=True):
+    for item in items:
+        q.put(item)
+    if stop:
+        put_stop(q)
+
+
+def test_drain_sentinels():
+    """Test drain stops after one sentinel per producer."""
+    q = Queue()
+    producers = [
+        Thread(target=produce, args=(q, range(i * 10, i * 10 + 10)))
+        for i in range(3)
+    ]
+    for producer in producers:
+        producer.start()
+    assert sorted(drain(q, sentinels=3)) == list(range(30))
+    assert q.unfinished_tasks == 0
+
+
+def test_drain_yields_as_items_arrive():
+    """Test items are yielded before the producer finishes."""
+    q = Queue()
+    q.put(1)
+    items = drain(q)
+    assert next(items) == 1
+    put_stop(q)
+    assert list(items) == []
+
+
+def test_drain_done():
+    """Test drain stops on a completion check once the queue is empty."""
+    q = Queue()
+    finished = []
+
+    def worker():
+        produce(q, range(5), stop=False)
+        finished.append(True)
+
+    Thread(target=worker).start()
+    assert list(drain(q, done=lambda: bool(finished))) == list(range(5))
+
+
+def test_drain_timeout():
+    """Test drain gives up after timeout seconds without an item."""
+    start = perf_counter()
+    assert list(drain(Queue(), timeout=0.05)) == []
+    assert list(drain(Queue(), done=lambda: False, timeout=0.05)) == []
+    assert perf_counter() - start < 1
+
+
+def test_unloadq_latency():
+    """Test unloadq returns promptly once stop is set and q is empty."""
+    q = Queue()
+    stopped = []
+
+    def worker():
+        sleep(0.05)
+        produce(q, 'abc', stop=False)
+        stopped.append(True)
+
+    Thread(target=worker).start()
+    start = perf_counter()
+    assert unloadq(q, lambda: bool(stopped)) == ['a', 'b', 'c']
+    assert perf_counter() - start < 1
+
+
+def test_stop_pickles_by_reference():
+    """Test STOP survives pickling and multiprocessing queues."""
+    assert pickle.loads(pickle.dumps(STOP)) is STOP
+    q = get_context('spawn').Queue()
+    produce(q, [1, 2])
+    assert list(drain(q, timeout=5)) == [1, 2]
+
+
+def test_get_batch():
+    """Test get_batch takes what is waiting, up to size."""
+    q = Queue()
+    for i in range(5):
+        q.put(i)
+    assert get_batch(q, 3) == [0, 1, 2]
+    assert get_batch(q, 3) == [3, 4]
+    assert q.empty()
+    for item in (0, STOP, 1):
+        q.put(item)
+    assert get_batch(q, 3) == [0, STOP]
+    assert get_batch(q, 3) == [1]
+
+
+def test_rebatch_multiplex_merge():
+    """Test a batched fan-out/fan-in topology delivers and stops."""
+    source = Queue(maxsize=8)
+    Thread(target=produce, args=(source, range(10000))).start()
+    batches = rebatch(source, size=100, maxsize=2)
+    left, right = multiplex_batches(2, batches, maxsize=2)
+    merged = merge_batches(left, right, maxsize=2)
+    items = list(iter_batches(merged))
+    assert sorted(items) == sorted([*range(10000)] * 2)
+    assert left.maxsize == right.maxsize == merged.maxsize == 2
+
+
+def test_rebatch_sentinels():
+    """Test rebatch keeps items behind a STOP until the last sentinel."""
+    source = Queue()
+    for item in (0, 1, STOP, 2, STOP):
+        source.put(item)
+    assert sorted(iter_batches(rebatch(source, sentinels=2))) == [0, 1, 2]
+
+
+class BrokenQueue(Queue):
+    """Queue whose get fails on the item 'boom'."""
+
+    def get(self, *args, **kwargs):
+        item = super().get(*args, **kwargs)
+        if item == 'boom':
+            raise OSError('boom')
+        return item
+
+
+def test_batches_pass_errors():
+    """Test a failing helper ends its outputs with the error, not STOP."""
+    source = BrokenQueue()
+    source.put((1, 2))
+    source.put('boom')
+    left, right = multiplex_batches(2, source)
+    with pytest.raises(OSError):
+        list(iter_batches(merge_batches(left, right)))
+    source = BrokenQueue()
+    for item in (1, 2, 'boom'):
+        source.put(item)
+    with pytest.raises(OSError):
+        list(iter_batches(rebatch(source)))
+
+
+def test_batches_backpressure():
+    """Test a stalled consumer bounds the batches in flight."""
+    source = Queue()
+    Thread(target=put_batches, args=(source, range(10000), 10)).start()
+    out_q, = multiplex_batches(1, source, maxsize=3)
+    sleep(0.1)
+    assert out_q.qsize() == 3
+    assert sum(map(len, drain(out_q))) == 10000
+
+
+def test_async_batches():
+    """Test the asyncio multiplex and merge counterparts."""
+
+    async def run():
+        source = asyncio.Queue(2)
+        producer = asyncio.ensure_future(
+            put_batches_async(source, range(1000), 10))
+        outs = multiplex_async(3, source, maxsize=2)
+        merged = merge_async(*outs, maxsize=2)
+        items = [item async for item in iter_batches_async(merged)]
+        await producer
+        return items
+
+    assert sorted(asyncio.run(run())) == sorted([*range(1000)] * 3)
+
+
+def square(x):
+    return x * x
+
+
+def fail_on_three(x):
+    if x == 3:
+        raise ValueError('three')
+    return x
+
+
+def slow_on_one(x):
+    if x == 1:
+        sleep(1)
+    return x
+
+
+def test_pipeline_kinds():
+    """Test thread, process, asyncio and stream stages chain together."""
+
+    async def double(x):
+        await asyncio.sleep(0)
+        return 2 * x
+
+    def running_sum(items):
+        total = 0
+        for item in items:
+            total += item
+            yield total
+
+    pipeline = Pipeline([
+        Stage('split', lambda x: [x, x], workers=3, flat=True, batch_size=7),
+        Stage('square', square, workers=2, kind='process', batch_size=50),
+        Stage('double', double, workers=8, kind='asyncio', maxsize=2),
+        Stage('sum', running_sum, kind='stream'),
+    ])
+    results = list(pipeline.run(range(100)))
+    assert len(results) == 200
+    assert max(results) == 4 * sum(x * x for x in range(100))
+    stats = {stats['stage']: stats for stats in pipeline.stats()}
+    assert stats['split']['items_in'] == 100
+    assert stats['split']['items_out'] == 200
+    assert stats['square']['items_in'] == stats['sum']['items_in'] == 200
+    assert 'items/s' in pipeline.report()
+
+
+def test_pipeline_filters_none():
+    """Test None results are dropped."""
+    pipeline = Pipeline([Stage('odd', lambda x: x if x % 2 else None)])
+    assert sorted(pipeline.run(range(10))) == [1, 3, 5, 7, 9]
+
+
+def test_pipeline_error():
+    """Test a stage error cancels the pipeline and is raised from run."""
+    calls = []
+
+    def fail(x):
+        calls.append(x)
+        return fail_on_three(x)
+
+    pipeline = Pipeline([
+        Stage('fail', fail, workers=4),
+        Stage('id', lambda x: x),
+    ])
+    outputs = []
+    with pytest.raises(PipelineError) as info:
+        outputs.extend(pipeline.run(range(200000)))
+    assert info.value.stage == 'fail'
+    assert isinstance(info.value.__cause__, ValueError)
+    assert not any(thread.is_alive() for thread in pipeline._threads)
+    # Siblings stop at their next batch instead of draining the source.
+    assert len(calls) <= 4 * BATCH_SIZE
+    assert len(outputs) <= 4 * BATCH_SIZE
+
+
+def test_pipeline_skip_errors():
+    """Test skip_errors drops failing items."""
+    pipeline = Pipeline([Stage('fail', fail_on_three, skip_errors=True)])
+    assert sorted(pipeline.run(range(5))) == [0, 1, 2, 4]
+
+
+def test_pipeline_early_exit():
+    """Test closing the output generator stops every worker."""
+    pipeline = Pipeline([Stage('id', lambda x: x, workers=2, batch_size=1,
+                               maxsize=1)])
+    outputs = pipeline.run(iter(range(10**9)))
+    assert next(outputs) is not None
+    outputs.close()
+    assert pipeline._threads == []
+
+
+def test_pipeline_reuse():
+    """Test a pipeline runs again after finishing, failing or closing."""
+    pipeline = Pipeline([Stage('id', fail_on_three, workers=2,
+                               batch_size=1)])
+    assert sorted(pipeline.run([0, 1, 2])) == [0, 1, 2]
+    assert all(q.empty() for q in pipeline.queues)
+    with pytest.raises(PipelineError):
+        list(pipeline.run(range(10)))
+    outputs = pipeline.run(iter([0, 1, 2]))
+    next(outputs)
+    outputs.close()
+    assert sorted(pipeline.run([4, 5])) == [4, 5]
+    assert pipeline.stats()[0]['items_in'] == 2
+
+
+def test_stage_kind():
+    """Test unknown stage kinds are rejected."""
+    with pytest.raises(ValueError):
+        Stage('bad', print, kind='fiber')
+
+
+def test_pipeline_process_error():
+    """Test a worker process error is raised from run."""
+    pipeline = Pipeline([
+        Stage('fail', fail_on_three, workers=2, kind='process', batch_size=1,
+              maxsize=1)
+    ])
+    with pytest.raises(PipelineError) as info:
+        list(pipeline.run(range(100)))
+    assert isinstance(info.value.__cause__, ValueError)
+
+
+def test_pipeline_process_uneven_batches():
+    """Test workers finishing before a slow sibling do not fail the stage."""
+    pipeline = Pipeline([
+        Stage('slow', slow_on_one, workers=2, kind='process', batch_size=1)
+    ])
+    assert sorted(pipeline.run(range(2))) == [0, 1]
+    assert sorted(pipeline.run(range(6))) == [*range(6)]
+
+
+def test_pipeline_process_skip_errors():
+    """Test worker processes drop failing items with skip_errors."""
+    pipeline = Pipeline([
+        Stage('fail', fail_on_three, workers=2, kind='process', batch_size=2,
+              skip_errors=True)
+    ])
+    assert sorted(pipeline.run(range(6))) == [0, 1, 2, 4, 5]
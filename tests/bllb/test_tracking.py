@@ -0,0 +1,59 @@
+"""Test bllb tracking."""
+import sqlite3
+from threading import Thread
+
+from bripy.bllb.tracking import PathTracker
+
+
+def test_add_reports_new(tmp_path):
+    """Test batches report only paths not seen before, in order."""
+    with PathTracker(tmp_path / 'tracking.db') as tracker:
+        assert tracker.add(['b', 'a', 'b']) == ['b', 'a']
+        assert tracker.add(['a', 'c', 'd']) == ['c', 'd']
+        assert tracker.add([]) == []
+        assert len(tracker) == 4
+        assert 'c' in tracker and 'e' not in tracker
+        assert (tracker.seen, tracker.added) == (6, 4)
+
+
+def test_track_persists(tmp_path):
+    """Test track streams new paths and survives reopening."""
+    database = tmp_path / 'tracking.db'
+    paths = [f'/data/{i}' for i in range(25)]
+    with PathTracker(database) as tracker:
+        assert list(tracker.track(paths[:20], batch_size=7)) == paths[:20]
+    with PathTracker(database) as tracker:
+        assert list(tracker.track(paths, batch_size=7)) == paths[20:]
+
+
+def test_existing_table(tmp_path):
+    """Test an existing tracking table is reused."""
+    database = tmp_path / 'tracking.db'
+    with sqlite3.connect(database) as connection:
+        connection.execute(
+            'CREATE TABLE files (path VARCHAR NOT NULL, PRIMARY KEY (path))')
+        connection.execute("INSERT INTO files VALUES ('old')")
+    with PathTracker(database) as tracker:
+        assert tracker.add(['old', 'new']) == ['new']
+
+
+def test_concurrent_writers(tmp_path):
+    """Test writers sharing a database each report only their own rows."""
+    database = tmp_path / 'tracking.db'
+    PathTracker(database).close()
+    news = []
+
+    def writer(offset):
+        with PathTracker(database) as tracker:
+            for start in range(0, 2000, 50):
+                news.append(tracker.add(
+                    f'/p/{i}' for i in range(offset + start,
+                                             offset + start + 100)))
+
+    threads = [Thread(target=writer, args=(offset, )) for offset in (0, 50)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    new = [path for batch in news for path in batch]
+    assert len(new) == len(set(new)) == 2100
@@ -0,0 +1,84 @@
+"""Test examinator catalog."""
+import os
+from pathlib import Path
+
+import pytest
+
+from bripy.bllb.filter import FilterSpec
+from bripy.examinator.catalog import Catalog, incremental_scan
+
+
+@pytest.fixture
+def tree(tmp_path):
+    """Create a small tree to scan."""
+    base = tmp_path / 'tree'
+    (base / 'sub').mkdir(parents=True)
+    (base / 'a.txt').write_text('a')
+    (base / 'sub' / 'b.txt').write_text('b')
+    return base
+
+
+def counting_hasher(calls):
+    def hasher(path):
+        calls.append(path)
+        return Path(path).read_text()
+    return hasher
+
+
+def test_incremental_scan(tree, tmp_path):
+    """Test that only new or changed files are hashed again."""
+    calls = []
+    hasher = counting_hasher(calls)
+    with Catalog(tmp_path / 'catalog.db') as catalog:
+        counts = incremental_scan(tree, catalog, hasher=hasher)
+        assert counts['new'] == 3
+        assert len(calls) == 2
+
+        calls.clear()
+        counts = incremental_scan(tree, catalog, hasher=hasher)
+        assert counts['unchanged'] == 3
+        assert calls == []
+
+        changed = tree / 'a.txt'
+        changed.write_text('changed')
+        os.utime(changed, ns=(0, 1))
+        counts = incremental_scan(tree, catalog, hasher=hasher)
+        assert counts['changed'] == 1
+        assert calls == [str(changed)]
+        assert catalog.get(changed)[1] == 'changed'
+
+
+def test_tombstones(tree, tmp_path):
+    """Test that deleted paths are tombstoned and revived."""
+    removed = tree / 'sub' / 'b.txt'
+    with Catalog(tmp_path / 'catalog.db') as catalog:
+        incremental_scan(tree, catalog, opt_md5=False)
+        removed.unlink()
+        counts = incremental_scan(tree, catalog, opt_md5=False)
+        assert counts['deleted'] == 1
+        assert catalog.tombstones() == [str(removed)]
+        removed.write_text('b')
+        incremental_scan(tree, catalog, opt_md5=False)
+        assert catalog.tombstones() == []
+
+
+def test_filtered_rescan(tree, tmp_path):
+    """Test paths rejected by a filter are not tombstoned."""
+    small, big = tree / 'a.txt', tree / 'sub' / 'big.txt'
+    big.write_text('x' * 5000)
+    with Catalog(tmp_path / 'catalog.db') as catalog:
+        incremental_scan(tree, catalog, opt_md5=False)
+        spec = FilterSpec(['sub/'], min_size=1000)
+        counts = incremental_scan(tree, catalog, opt_md5=False, spec=spec)
+        assert counts['deleted'] == 0
+        assert catalog.tombstones() == []
+        assert not catalog.get(small)[3]
+        big.write_text('shrunk')
+        counts = incremental_scan(tree, catalog, opt_md5=False,
+                                  spec=FilterSpec(min_size=1000))
+        assert counts['deleted'] == 0
+        big.unlink()
+        counts = incremental_scan(tree, catalog, opt_md5=False,
+                                  spec=FilterSpec(min_size=1000))
+        assert counts['deleted'] == 1
+        assert catalog.tombstones() == [str(big)]
@@ -0,0 +1,80 @@
+"""Test daskerator walkers."""
+import pytest
+from dask.distributed import Client
+
+from bripy.examinator.daskerator import (inventory, list_dirs, walk,
+                                          walk_stealing, walk_subtree)
+
+
+@pytest.fixture(scope="module")
+def client():
+    """Start an in-process dask client."""
+    with Client(processes=False, dashboard_address=None) as client:
+        yield client
+
+
+@pytest.fixture
+def tree(tmp_path):
+    """Create a tree with several levels."""
+    for d in ('a/b/c', 'a/d', 'e'):
+        (tmp_path / d).mkdir(parents=True)
+    for d in ('', 'a', 'a/b/c', 'a/d', 'e'):
+        (tmp_path / d / 'file.txt').write_text(d)
+    return tmp_path
+
+
+def test_list_dirs(tree):
+    """Test listing splits directories and files."""
+    dirs, files = list_dirs([str(tree), str(tree / 'a')])
+    assert sorted(dirs) == sorted(
+        f'file://{tree / d}' for d in ('a', 'e', 'a/b', 'a/d'))
+    assert [info['type'] for info in files] == ['file', 'file']
+    assert all(info['name'].startswith('file://') for info in files)
+
+
+def test_walk(client, tree):
+    """Test batched walk finds every file."""
+    files = [info['name'] for info in walk(client, str(tree), batch_size=1)]
+    expected = [f'file://{path}' for path in tree.rglob('file.txt')]
+    assert sorted(files) == sorted(expected)
+
+
+def test_walk_subtree(tree):
+    """Test subtree walks stop at the budget and return the frontier."""
+    frontier, files = walk_subtree([str(tree)], budget=2)
+    assert len(files) == 2
+    assert frontier
+    while frontier:
+        frontier, more = walk_subtree(frontier, budget=1)
+        files.extend(more)
+    assert len(files) == 5
+
+
+def test_walk_stealing(client, tree):
+    """Test budgeted walk finds every file."""
+    files = [
+        info['name']
+        for info in walk_stealing(client, str(tree), budget=1, slots=3)
+    ]
+    expected = [f'file://{path}' for path in tree.rglob('file.txt')]
+    assert sorted(files) == sorted(expected)
+
+
+def test_inventory(client, tree):
+    """Test inventory partitions stay on workers until computed."""
+    df = inventory(client, str(tree), budget=1, slots=2, opt_md5=True)
+    assert df.npartitions > 1
+    frame = df.compute()
+    assert len(frame) == 5
+    assert frame['digest'].notna().all()
+    assert sorted(frame['name']) == sorted(
+        str(path) for path in tree.rglob('file.txt'))
+
+
+def test_inventory_parquet(client, tree, tmp_path_factory):
+    """Test inventory creates and writes parquet output on the workers."""
+    pd = pytest.importorskip('pandas')
+    pytest.importorskip('pyarrow')
+    output = tmp_path_factory.mktemp('inventory') / 'nested'
+    assert inventory(client, str(tree), budget=2, output=str(output)) == 5
+    assert len(pd.read_parquet(output)) == 5
@@ -0,0 +1,55 @@
+"""Test examinator duplicate finder."""
+import pytest
+
+from bripy.bllb.file import md5_blocks
+from bripy.examinator.catalog import Catalog, incremental_scan
+from bripy.examinator.dupes import catalog_duplicates, find_duplicates
+
+CHUNK = 4
+
+
+@pytest.fixture
+def tree(tmp_path):
+    """Create files with shared sizes, prefixes and content."""
+    base = tmp_path / 'tree'
+    base.mkdir()
+    contents = {
+        'unique.txt': 'only one of this size',
+        'small_1.txt': 'abc',
+        'small_2.txt': 'abc',
+        'small_3.txt': 'abd',
+        'big_1.txt': 'head' + 'x' * 20 + 'tail',
+        'big_2.txt': 'head' + 'x' * 20 + 'tail',
+        'big_3.txt': 'head' + 'y' * 20 + 'tail',
+        'big_4.txt': 'HEAD' + 'x' * 20 + 'tail',
+        'empty_1.txt': '',
+        'empty_2.txt': '',
+    }
+    for name, text in contents.items():
+        (base / name).write_text(text)
+    return base
+
+
+def test_find_duplicates(tree):
+    """Test only colliding partial hashes are fully hashed."""
+    files = [(path, path.stat().st_size) for path in tree.iterdir()]
+    stats = {}
+    dupes = find_duplicates(files, chunk_size=CHUNK, stats=stats)
+    groups = sorted(sorted(p.rsplit('/', 1)[-1] for p in paths)
+                    for paths in dupes.values())
+    assert groups == [['big_1.txt', 'big_2.txt'],
+                      ['empty_1.txt', 'empty_2.txt'],
+                      ['small_1.txt', 'small_2.txt']]
+    assert md5_blocks(tree / 'big_1.txt') in dupes
+    assert stats['partial_hashed'] == 7
+    assert stats['full_hashed'] == 3
+
+
+def test_catalog_duplicates(tree, tmp_path):
+    """Test duplicates from catalog digests need no content reads."""
+    with Catalog(tmp_path / 'catalog.db') as catalog:
+        incremental_scan(tree, catalog)
+        stats = {}
+        dupes = catalog_duplicates(catalog, chunk_size=CHUNK, stats=stats)
+    assert sorted(map(len, dupes.values())) == [2, 2, 2]
+    assert stats['bytes_read'] == 0
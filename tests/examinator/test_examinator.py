@@ -2,10 +2,14 @@
 # -*- coding: utf-8 -*-
 """Tests for `examinator` package."""
 
+import os
+import sqlite3
+import tempfile
 import unittest
 from click.testing import CliRunner
 
 from bripy.examinator.daskerator import main
+from bripy.examinator.cli import main as examinator_main
 
 
 class TestExaminator(unittest.TestCase):
@@ -24,3 +28,44 @@ class TestExaminator(unittest.TestCase):
         help_result = runner.invoke(main, ['--help'])
         assert help_result.exit_code == 0
         assert 'Show this message and exit.' in help_result.output
+
+    def test_examinator_cli(self):
+        """Test the examinator CLI scans roots and reports timings."""
+        runner = CliRunner()
+        help_result = runner.invoke(examinator_main, ['--help'])
+        assert help_result.exit_code == 0
+        assert '--batch-size' in help_result.output
+        with tempfile.TemporaryDirectory() as tmp:
+            roots = [os.path.join(tmp, root) for root in ('one', 'two')]
+            for root in roots:
+                os.makedirs(os.path.join(root, 'sub'))
+                with open(os.path.join(root, 'sub', 'file.txt'), 'w') as file:
+                    file.write(root)
+            output = os.path.join(tmp, 'output.db')
+            result = runner.invoke(examinator_main, [
+                *roots, '--output', output, '--algorithm', 'sha1',
+                '--batch-size', '1', '--interval', '0'
+            ])
+            assert result.exit_code == 0, result.output
+            assert 'Records written: 4' in result.output
+            assert 'hash' in result.output
+            with sqlite3.connect(output) as connection:
+                rows = connection.execute(
+                    'SELECT hash_algorithm FROM files '
+                    'WHERE is_file = 1').fetchall()
+            assert rows == [('sha1', ), ('sha1', )]
+            result = runner.invoke(examinator_main, [
+                *roots, '--output', output, '--exclude', 'sub/',
+                '--interval', '0'
+            ])
+            assert result.exit_code == 0, result.output
+            assert 'Records written: 0' in result.output
+            cache = os.path.join(tmp, 'hashes.db')
+            for hits in (0, 2):
+                os.remove(output)
+                result = runner.invoke(examinator_main, [
+                    *roots, '--output', output, '--hash-cache', cache,
+                    '--interval', '0'
+                ])
+                assert result.exit_code == 0, result.output
+                assert f'Hash cache: {hits} hits' in result.output
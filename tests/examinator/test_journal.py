@@ -0,0 +1,89 @@
+"""Test examinator checkpoint journal."""
+import sqlite3
+
+import pytest
+
+from bripy.bllb.fs import get_entry_stat
+from bripy.examinator.journal import Journal
+from bripy.examinator.sink import SqliteSink
+
+
+@pytest.fixture
+def tree(tmp_path):
+    """Create a nested tree to scan."""
+    base = tmp_path / 'tree'
+    for d in ('a', 'a/b', 'c', 'empty'):
+        (base / d).mkdir(parents=True)
+    for d in ('', 'a', 'a/b', 'c'):
+        for i in range(3):
+            (base / d / f'{i}.txt').write_text(str(i))
+    return base
+
+
+def scan(tree, database, resume=False, limit=None):
+    """Scan tree into database, abandoning the run after limit records."""
+    sink = SqliteSink(database, batch_size=2)
+    journal = Journal(sink, resume=resume)
+    for count, entry in enumerate(journal.walk(tree)):
+        if count == limit:
+            sink.connection.close()
+            return
+        sink.add(get_entry_stat(entry))
+    sink.close()
+
+
+def test_resume(tree, tmp_path):
+    """Test a crashed scan resumes without repeating written entries."""
+    database = tmp_path / 'output.db'
+    scan(tree, database, limit=9)
+    with sqlite3.connect(database) as connection:
+        written = connection.execute('SELECT count(*) FROM files').fetchone()
+        done = connection.execute(
+            'SELECT count(*) FROM journal WHERE done = 1').fetchone()
+    assert written == (8, )
+    assert done[0] >= 1
+    scan(tree, database, resume=True)
+    with sqlite3.connect(database) as connection:
+        paths = [
+            row[0] for row in connection.execute('SELECT path FROM files')
+        ]
+        pending = connection.execute(
+            'SELECT count(*) FROM journal WHERE done = 0').fetchone()
+    expected = sorted(str(path) for path in tree.rglob('*'))
+    assert sorted(paths) == expected
+    assert pending == (0, )
+
+
+def test_resume_finished(tree, tmp_path):
+    """Test resuming a finished scan does nothing."""
+    database = tmp_path / 'output.db'
+    scan(tree, database)
+    sink = SqliteSink(database)
+    assert [*Journal(sink, resume=True).walk(tree)] == []
+    sink.close()
+
+
+def test_fresh_run_replaces_output(tree, tmp_path):
+    """Test a run without resume replaces an earlier run's rows."""
+    database = tmp_path / 'output.db'
+    scan(tree, database)
+    scan(tree, database, limit=5)
+    scan(tree, database, resume=True)
+    with sqlite3.connect(database) as connection:
+        paths = [
+            row[0] for row in connection.execute('SELECT path FROM files')
+        ]
+    assert sorted(paths) == sorted(str(path) for path in tree.rglob('*'))
+
+
+def test_fresh_run_upgrades_schema(tree, tmp_path):
+    """Test a fresh run recreates an output table with older columns."""
+    database = tmp_path / 'output.db'
+    with sqlite3.connect(database) as connection:
+        connection.execute('CREATE TABLE files (path TEXT)')
+        connection.execute("INSERT INTO files VALUES ('old')")
+    scan(tree, database)
+    with sqlite3.connect(database) as connection:
+        count, = connection.execute(
+            'SELECT count(st_blocks) FROM files').fetchone()
+    assert count == len([*tree.rglob('*')])
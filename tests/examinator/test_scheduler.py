@@ -0,0 +1,117 @@
+"""Test examinator hash scheduler."""
+import os
+from threading import Event, Thread, current_thread
+
+from bripy.bllb.file import md5_blocks
+from bripy.bllb.fs import scan_stat
+from bripy.examinator.scheduler import HashScheduler, ProcessHashScheduler
+
+
+def test_scheduler_lanes(tmp_path):
+    """Test files are hashed in per-device and large file lanes."""
+    for i in range(6):
+        (tmp_path / f'{i}.txt').write_text(str(i) * (i + 1))
+    (tmp_path / 'sub').mkdir()
+    threads = {}
+
+    def hasher(path):
+        threads[path] = current_thread().name
+        return md5_blocks(path)
+
+    records = [*scan_stat(tmp_path)]
+    with HashScheduler(device_workers=2, large_file=4, max_pending=2,
+                       hasher=hasher) as scheduler:
+        results = [*scheduler.run(records)]
+        assert len(scheduler.lanes) == 2
+    assert len(results) == len(records)
+    assert scheduler.pending == 0
+    assert scheduler.files_hashed == 6
+    for record in results:
+        if record['is_file']:
+            assert record['digest'] == md5_blocks(record['path'])
+            large = record['st_size'] >= 4
+            assert ('-large' in threads[record['path']]) == large
+        else:
+            assert 'digest' not in record
+
+
+def test_scheduler_queue_depths(tmp_path):
+    """Test queue depths count hashes submitted but not finished."""
+    (tmp_path / 'a.txt').write_text('a')
+    (tmp_path / 'b.txt').write_text('b')
+    release = Event()
+
+    def hasher(path):
+        release.wait()
+        return md5_blocks(path)
+
+    records = [*scan_stat(tmp_path)]
+    with HashScheduler(device_workers=1, hasher=hasher) as scheduler:
+        for record in records:
+            scheduler.submit(record)
+        device = records[0]['st_dev']
+        assert scheduler.queue_depths() == {f'{device}': 2}
+        release.set()
+        for executor in scheduler.lanes.values():
+            executor.shutdown()
+        assert scheduler.queue_depths() == {f'{device}': 0}
+
+
+def test_scheduler_depths_while_adding_lanes():
+    """Test queue depths can be read while new devices add lanes."""
+    with HashScheduler() as scheduler:
+        adder = Thread(target=lambda: [
+            scheduler.lane(device, False) for device in range(5000)
+        ])
+        adder.start()
+        while adder.is_alive():
+            scheduler.queue_depths()
+        adder.join()
+        assert len(scheduler.queue_depths()) == 5000
+
+
+def test_process_scheduler(tmp_path):
+    """Test batched process pool hashing."""
+    for i in range(10):
+        (tmp_path / f'{i}.txt').write_text(str(i))
+    records = [*scan_stat(tmp_path)]
+    with ProcessHashScheduler(workers=2, batch_size=3,
+                              max_pending=4) as scheduler:
+        results = [*scheduler.run(records)]
+    assert len(results) == 10
+    assert scheduler.files_hashed == 10
+    for record in results:
+        assert record['digest'] == md5_blocks(record['path'])
+
+
+def test_scheduler_hardlinks(tmp_path):
+    """Test each physical file is hashed once and links are counted."""
+    (tmp_path / 'a.txt').write_text('linked')
+    for name in ('b.txt', 'c.txt'):
+        os.link(tmp_path / 'a.txt', tmp_path / name)
+    (tmp_path / 'd.txt').write_text('single')
+    hashed = []
+
+    def hasher(path):
+        hashed.append(path)
+        return md5_blocks(path)
+
+    records = [*scan_stat(tmp_path)]
+    with HashScheduler(device_workers=2, hasher=hasher) as scheduler:
+        results = [*scheduler.run(records)]
+    assert len(results) == 4
+    assert len(hashed) == 2
+    assert scheduler.files_hashed == 2
+    assert scheduler.files_linked == 2
+    assert {record['digest'] for record in results} == {
+        md5_blocks(tmp_path / 'a.txt'),
+        md5_blocks(tmp_path / 'd.txt')
+    }
+    assert scheduler.link_groups == 1
+    # Every link was seen, so nothing is held for the rest of the run.
+    assert scheduler.link_counts == {} and scheduler.digests == {}
+    with ProcessHashScheduler(workers=1, batch_size=1) as scheduler:
+        results = [*scheduler.run([*scan_stat(tmp_path)])]
+    assert len(results) == 4
+    assert scheduler.files_hashed == 2
+    assert all(record['digest'] for record in results)
@@ -0,0 +1,78 @@
+"""Test examinator output sinks."""
+import os
+import sqlite3
+
+import pytest
+
+from bripy.bllb.fs import scan_stat
+from bripy.examinator.sink import BatchSink, ParquetSink, SqliteSink
+
+
+@pytest.fixture
+def records(tmp_path):
+    """Create stat records for a small tree."""
+    base = tmp_path / 'tree'
+    base.mkdir()
+    for i in range(5):
+        (base / f'{i}.txt').write_text(str(i))
+    return [*scan_stat(base, opt_md5=True)]
+
+
+def test_sqlite_sink(records, tmp_path):
+    """Test records are flushed in batches and committed."""
+    database = tmp_path / 'output.db'
+    sink = SqliteSink(database, batch_size=2)
+    sink.extend(records)
+    assert sink.batches == 2
+    with sqlite3.connect(database) as connection:
+        count, = connection.execute('SELECT count(*) FROM files').fetchone()
+    assert count == 4
+    sink.close()
+    with sqlite3.connect(database) as connection:
+        rows = connection.execute(
+            'SELECT path, st_size, digest FROM files ORDER BY path').fetchall()
+    assert sink.total == len(rows) == 5
+    assert rows[0][1:] == (1, 'cfcd208495d565ef66e7dff9f98764da')
+
+
+def test_sqlite_hardlinks_view(tmp_path):
+    """Test hardlink groups are reported from the output table."""
+    base = tmp_path / 'tree'
+    base.mkdir()
+    (base / 'a.txt').write_text('a')
+    os.link(base / 'a.txt', base / 'b.txt')
+    (base / 'c.txt').write_text('c')
+    database = tmp_path / 'output.db'
+    with SqliteSink(database) as sink:
+        sink.extend(scan_stat(base))
+    with sqlite3.connect(database) as connection:
+        rows = connection.execute(
+            'SELECT links, paths FROM files_hardlinks').fetchall()
+    assert len(rows) == 1
+    assert rows[0][0] == 2
+    assert sorted(rows[0][1].split('\n')) == [
+        str(base / 'a.txt'), str(base / 'b.txt')
+    ]
+
+
+def test_parquet_sink(records, tmp_path):
+    """Test every batch is a complete parquet file as soon as it flushes."""
+    pq = pytest.importorskip('pyarrow.parquet')
+    path = tmp_path / 'output.parquet'
+    path.mkdir()
+    (path / 'part-000009.parquet').write_text('stale')
+    sink = ParquetSink(path, batch_size=2)
+    sink.extend(records[:4])
+    # Readable before close, as after a crash.
+    assert pq.read_table(path).num_rows == 4
+    sink.extend(records[4:] + [{'path': 'error'}])
+    sink.close()
+    parts = sorted(part.name for part in path.iterdir())
+    assert parts == [f'part-{i:06d}.parquet' for i in range(3)]
+    assert pq.read_table(path).num_rows == 6
+
+
+def test_batch_sink_abstract():
+    """Test BatchSink needs a write_batch implementation."""
+    with pytest.raises(TypeError):
+        BatchSink()